@@ -0,0 +1,423 @@
+import os
+import re
+import subprocess
+import time
+from datetime import datetime
+
+import cancellation
+import device_props
+import journal
+
+# ADB-level setup steps shared by the GUI (pico_setup.py) and the end-to-end
+# runner (bringup.py).
+#
+# The Kandel scripts can run detached on the device (execute_script_detached):
+# started under nohup with their output and exit status in files, then tailed
+# over short adb calls that survive the device dropping off Wi-Fi. Stopping the
+# bring-up kills the script on the device.
+
+# Directory on the device's SD card holding the Kandel setup scripts
+SCRIPT_DIR = "/mnt/media_rw/40F465C7F465C030/Akiba_new_setup"
+
+# Files that must be in SCRIPT_DIR before the scripts run
+REQUIRED_FILES = [
+    '1_Kandel_setup.sh',
+    '2_Kandel_setup.sh',
+    'dev900.ovpn',
+    'debian_stretch_rootfs_release_20200309.tgz'
+]
+
+# Where detached script runs keep their output log, pid and exit status
+SCRIPT_RUN_DIR = "/data/local/tmp/pico_scripts"
+
+# Divides the sections of the detached script poll output
+POLL_SEPARATOR = "==pico-poll=="
+
+
+def script_timeout(script_name):
+    return 600 if script_name == "1_Kandel_setup.sh" else 300
+
+
+def script_done_path(script_name):
+    """Completion record of a script: md5sum of the exact script that last succeeded."""
+    return f"{SCRIPT_RUN_DIR}/{script_name}.done"
+
+
+def mark_done_command(script_name, script_dir):
+    return (f"su -c 'mkdir -p {SCRIPT_RUN_DIR} && "
+            f"md5sum {script_dir}/{script_name} > {script_done_path(script_name)}'")
+
+
+def _run_paths(script_name):
+    """(log, pid file, exit status file) of a detached script run."""
+    base = f"{SCRIPT_RUN_DIR}/{script_name}"
+    return f"{base}.log", f"{base}.pid", f"{base}.exit"
+
+
+def _alive_test(pid):
+    """Shell test that the pid file's process is alive and was started since the last boot.
+
+    The pid file holds '<pid> <boot_id>'; after a reboot the pid may belong
+    to an unrelated process, so it only counts with the current boot_id.
+    Leaves the pid in $1.
+    """
+    return (f"set -- $(cat {pid} 2>/dev/null); [ -n \"$1\" ] && "
+            f"[ \"$2\" = \"$(cat /proc/sys/kernel/random/boot_id)\" ] && kill -0 $1 2>/dev/null")
+
+
+def _start_command(script_name, script_dir):
+    """Start the script under nohup unless it is still running; prints 'running' or 'started'.
+
+    The script gets its own session (setsid, where the device has it), so
+    _kill_command can stop it together with everything it started.
+    """
+    log, pid, status = _run_paths(script_name)
+    inner = (f"mkdir -p {SCRIPT_RUN_DIR} && cd {script_dir} && "
+             f"if {_alive_test(pid)} && [ ! -f {status} ]; then echo running; "
+             f"else rm -f {status} {log} {script_done_path(script_name)}; "
+             f"$(command -v setsid) nohup sh -c \"sh {script_name} > {log} 2>&1; echo \\$? > {status}\" "
+             f"> /dev/null 2>&1 < /dev/null & "
+             f"echo $! $(cat /proc/sys/kernel/random/boot_id) > {pid}; echo started; fi")
+    return f"su -c '{inner}'"
+
+
+def _kill_command(script_name):
+    """Kill a detached script run (its process group, or its children without setsid) and forget it.
+
+    Prints 'killed' once the pid and exit status files are gone.
+    """
+    log, pid, status = _run_paths(script_name)
+    inner = (f"if {_alive_test(pid)}; then kill -9 -$1 2>/dev/null || pkill -9 -P $1; kill -9 $1 2>/dev/null; fi; "
+             f"rm -f {pid} {status} && echo killed")
+    return f"su -c '{inner}'"
+
+
+def _poll_command(script_name, offset):
+    """Whether the script is alive, its exit status, the log size and the log from offset on.
+
+    The exit status is read before the log, so once it is there the log read
+    after it is complete.
+    """
+    log, pid, status = _run_paths(script_name)
+    sep = f"echo {POLL_SEPARATOR}"
+    inner = (f"{_alive_test(pid)} && echo alive; {sep}; cat {status} 2>/dev/null; {sep}; "
+             f"s=$(wc -c < {log}); echo $s; {sep}; tail -c +{offset + 1} {log} | head -c $((s - {offset}))")
+    return f"su -c '{inner}'"
+
+
+class AdbSetup:
+    """Connect, mount, verify, run the Kandel scripts and reboot over adb.
+
+    log() prints by default; the GUI overrides it to write to its log area.
+    """
+
+    def log(self, message):
+        print(message)
+
+    def validate_ip(self, ip):
+        """Validate IPv4 format using regex."""
+        pattern = r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$'
+        return re.match(pattern, ip) is not None
+
+    def run_adb_command(self, command, timeout=30):
+        """Run adb command and return output or None on failure."""
+        try:
+            result = journal.run(['adb'] + command,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 text=True,
+                                 timeout=timeout,
+                                 check=True)
+            return result.stdout.strip()
+        except subprocess.TimeoutExpired:
+            self.log(f"Command timed out after {timeout} seconds: {' '.join(command)}")
+            return None
+        except subprocess.CalledProcessError as e:
+            self.log(f"Command failed: {' '.join(command)}\nError: {e.stderr.strip()}")
+            return None
+
+    def mount_system_rw(self, serial=None):
+        """Mount /system partition as read-write."""
+        self.log("\nMounting /system as read-write...")
+        base_command = ['shell', 'su', '-c', 'mount -o rw,remount /system']
+        if serial:
+            base_command = ['-s', serial] + base_command
+
+        result = self.run_adb_command(base_command)
+        if result is None:
+            self.log("Failed to remount /system as read-write")
+            return False
+        self.log("Successfully mounted /system as read-write")
+        return True
+
+    def connect_device(self, ip, port=5555, max_retries=5, delay=5):
+        """Attempt to connect to the device via adb over network."""
+        for attempt in range(1, max_retries + 1):
+            self.log(f"\nConnection attempt {attempt} of {max_retries} to {ip}:{port}...")
+            # Only this device: a bare disconnect would drop every other one too
+            self.run_adb_command(['disconnect', f"{ip}:{port}"], timeout=5)
+            result = self.run_adb_command(['connect', f"{ip}:{port}"])
+            if result and "connected" in result:
+                devices = self.run_adb_command(['devices'])
+                if devices and f"{ip}:{port}" in devices:
+                    self.log("Connection successful!")
+                    return True
+            self.log(f"Connection failed. Retrying in {delay} seconds...")
+            time.sleep(delay)
+        self.log(f"Failed to connect to {ip} after {max_retries} attempts")
+        return False
+
+    def verify_files_exist(self, script_dir):
+        """Check required files exist on device."""
+        self.log("\nVerifying required files on device...")
+        missing_files = []
+
+        dir_check = self.run_adb_command(['shell', f'[ -d "{script_dir}" ] && echo "exists"'])
+        if dir_check != "exists":
+            self.log(f"Directory not found: {script_dir}")
+            return False
+
+        for file in REQUIRED_FILES:
+            file_path = os.path.join(script_dir, file).replace('\\', '/')
+            res = self.run_adb_command(['shell', f'[ -f "{file_path}" ] && echo "exists"'])
+            if res == "exists":
+                self.log(f"Found: {file}")
+            else:
+                self.log(f"Missing: {file}")
+                missing_files.append(file)
+
+        if missing_files:
+            self.log("\nMissing required files:")
+            for file in missing_files:
+                self.log(f"- {file}")
+            return False
+
+        self.log("All required files found.")
+        return True
+
+    def execute_script(self, script_name, script_dir, ip, max_retries=3, timeout=None):
+        """Run a shell script on device as root with reconnection handling."""
+        timeout = timeout or script_timeout(script_name)
+        attempt = 1
+        while attempt <= max_retries:
+            self.log(f"\nExecuting {script_name} (Attempt {attempt} of {max_retries})...")
+            if attempt > 1:
+                journal.event("retry", what=script_name, attempt=attempt)
+            start = datetime.now()
+            self.log(f"Start time: {start.strftime('%H:%M:%S')}")
+
+            cmd = f"su -c 'rm -f {script_done_path(script_name)}; cd {script_dir} && sh {script_name}'"
+            self.log(f"Running command: adb shell {cmd}")
+
+            try:
+                result = journal.run(['adb', 'shell', cmd],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     text=True,
+                                     timeout=timeout,
+                                     check=True)
+                
+                output = result.stdout.strip()
+                self.log("\nScript output:\n" + "-" * 60)
+                self.log(output)
+                self.log("-" * 60)
+
+                if not self.check_script_output(script_name, output):
+                    return False
+                self.run_adb_command(['shell', mark_done_command(script_name, script_dir)])
+
+                end = datetime.now()
+                duration = (end - start).total_seconds()
+                self.log(f"Execution time: {duration:.2f} seconds")
+                self.log(f"End time: {end.strftime('%H:%M:%S')}")
+                return True
+
+            except subprocess.TimeoutExpired:
+                self.log(f"Error: {script_name} timed out.")
+                attempt += 1
+                if attempt <= max_retries:
+                    self.log("Waiting 10 seconds before retrying...")
+                    time.sleep(10)
+                continue
+                
+            except subprocess.CalledProcessError as e:
+                error_msg = e.stderr.strip()
+                self.log(f"Error executing {script_name}:\n{error_msg}")
+                
+                if "device offline" in error_msg.lower():
+                    self.log("Device went offline during execution. Attempting to reconnect...")
+                    if not self.reboot_device_and_wait(ip):
+                        self.log("Failed to reconnect to device.")
+                        return False
+                    attempt += 1
+                    continue
+                    
+                return False
+
+        self.log(f"Failed to execute {script_name} after {max_retries} attempts")
+        return False
+
+    def check_script_output(self, script_name, output):
+        """False if a finished script's output reports errors."""
+        if "END Kandel SETUP" not in output:
+            self.log(f"Warning: {script_name} may not have completed successfully.")
+
+        error_keywords = ["No such file", "can't open", "Permission denied"]
+        if any(err in output for err in error_keywords):
+            self.log(f"Errors detected in {script_name} output.")
+            return False
+        return True
+
+    def execute_script_detached(self, script_name, script_dir, ip, max_retries=3, poll_interval=5, timeout=None):
+        """Run a shell script on device as root, detached from the adb session.
+
+        The script runs under nohup with its output and exit status in files
+        under SCRIPT_RUN_DIR. Short adb calls tail the output and poll for the
+        exit status, reconnecting in between if the device drops off, so a
+        lost connection never restarts the script. A script still running from
+        an earlier attempt is followed instead of started again.
+        """
+        serial = f"{ip}:5555"
+        timeout = timeout or script_timeout(script_name)
+        attempt = 1
+        while attempt <= max_retries:
+            self.log(f"\nExecuting {script_name} detached (Attempt {attempt} of {max_retries})...")
+            if attempt > 1:
+                journal.event("retry", what=script_name, attempt=attempt)
+            start = datetime.now()
+            self.log(f"Start time: {start.strftime('%H:%M:%S')}")
+
+            # Stopping the bring-up from here on stops the script as well
+            with cancellation.on_cancel(['adb', '-s', serial, 'shell', _kill_command(script_name)]):
+                started = self._poll_shell(serial, _start_command(script_name, script_dir))
+                if started is None:
+                    self.log(f"Could not start {script_name}; reconnecting...")
+                    self.connect_device(ip, max_retries=1, delay=poll_interval)
+                    attempt += 1
+                    continue
+                if "running" in started.split():
+                    self.log(f"{script_name} is still running on the device from an earlier attempt; following it.")
+
+                self.log("\nScript output:\n" + "-" * 60)
+                status, output, timed_out = self._follow_script(serial, ip, script_name, timeout, poll_interval)
+            self.log("-" * 60)
+
+            if timed_out:
+                self.log(f"Error: {script_name} still running after {timeout:.0f} seconds; stopping it.")
+                killed = self._poll_shell(serial, _kill_command(script_name))
+                if killed is None or "killed" not in killed.split():
+                    self.log(f"Could not stop {script_name} on the device; giving up.")
+                    return False
+                attempt += 1
+                continue
+            if status is None:
+                self.log(f"Error: {script_name} stopped without an exit status (device rebooted?).")
+                attempt += 1
+                continue
+            if status != 0:
+                self.log(f"Error executing {script_name}: exit status {status}")
+                return False
+
+            if not self.check_script_output(script_name, output):
+                return False
+            self._poll_shell(serial, mark_done_command(script_name, script_dir))
+
+            end = datetime.now()
+            duration = (end - start).total_seconds()
+            self.log(f"Execution time: {duration:.2f} seconds")
+            self.log(f"End time: {end.strftime('%H:%M:%S')}")
+            return True
+
+        self.log(f"Failed to execute {script_name} after {max_retries} attempts")
+        return False
+
+    def _follow_script(self, serial, ip, script_name, timeout, poll_interval):
+        """Log a detached script's output until it exits; (exit status or None, output, timed out)."""
+        output = []
+        pending = ""
+        offset = 0
+        connected = True
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            poll = self._poll_shell(serial, _poll_command(script_name, offset))
+            parts = poll.split(POLL_SEPARATOR + "\n", 3) if poll is not None else []
+            if len(parts) < 4:
+                if connected:
+                    self.log("Lost the connection; the script keeps running on the device. Reconnecting...")
+                    connected = False
+                self.connect_device(ip, max_retries=1, delay=poll_interval)
+                continue
+            if not connected:
+                self.log("Reconnected; following the script again.")
+                connected = True
+
+            alive, status, size, chunk = parts
+            output.append(chunk)
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            if lines:
+                self.log("\n".join(lines))
+            if size.strip().isdigit():
+                offset = int(size)
+
+            if status.strip().lstrip("-").isdigit():
+                if pending:
+                    self.log(pending)
+                return int(status), "".join(output), False
+            if "alive" not in alive:
+                return None, "".join(output), False
+            time.sleep(poll_interval)
+        return None, "".join(output), True
+
+    def _poll_shell(self, serial, command, timeout=30):
+        """Output of a short adb shell call, or None if the device can't be reached."""
+        try:
+            return journal.run(['adb', '-s', serial, 'shell', command],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               text=True,
+                               errors="replace",
+                               timeout=timeout,
+                               check=True).stdout
+        except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
+            return None
+
+    def reboot_device_and_wait(self, ip, reboot_timeout=60, connect_timeout=300, poll_interval=5):
+        """Reboot device and wait until it reconnects."""
+        self.log("\nRebooting device...")
+        device_props.invalidate(f"{ip}:5555")
+        reboot_result = self.run_adb_command(['reboot'], timeout=reboot_timeout)
+        if reboot_result is None:
+            self.log("Warning: adb reboot command failed or timed out.")
+
+        self.log("Waiting for device to go offline...")
+        start_time = time.time()
+        device_offline = False
+
+        while time.time() - start_time < connect_timeout:
+            try:
+                devices_output = journal.run(['adb', 'devices'],
+                                              capture_output=True, text=True, check=True, timeout=10).stdout
+                if f"{ip}:5555\toffline" in devices_output or f"{ip}:5555" not in devices_output:
+                    self.log("Device offline detected. Waiting for reconnection...")
+                    device_offline = True
+                    break
+            except Exception:
+                self.log("ADB command error, assuming device is rebooting...")
+                device_offline = True
+                break
+            time.sleep(poll_interval)
+
+        if not device_offline:
+            self.log("Timeout waiting for device to go offline.")
+            return False
+
+        self.log("Waiting for device to reconnect...")
+        while time.time() - start_time < connect_timeout:
+            if self.connect_device(ip, max_retries=1, delay=2):
+                self.log("Device reconnected successfully.")
+                return True
+            time.sleep(poll_interval)
+
+        self.log("Timeout waiting for device to reconnect.")
+        return False
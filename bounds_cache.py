@@ -0,0 +1,47 @@
+import os
+
+from json_store import JsonStore
+
+# Cached screen positions of stable UI controls.
+#
+# Controls such as the app drawer button, OpenVPN's navigation drawer icon or
+# its SAVE button sit at the same place on every device of a model running
+# the same resolution. Once found, their bounds are stored per
+# "<model>|<width>x<height>" and the flow engine taps them directly next
+# time, confirming the expected transition and dropping the entry on a
+# mismatch.
+
+CACHE_FILE = os.path.join("pico_state", "bounds_cache.json")
+
+
+def bounds_profile(model, width, height):
+    return f"{model}|{width}x{height}"
+
+
+class BoundsCache(JsonStore):
+    """Persistent per-profile bounds of flow targets, keyed by step id."""
+
+    def __init__(self, path=CACHE_FILE):
+        super().__init__(path)
+
+    def get(self, profile, target):
+        """Return the (x, y) tap point for a target, or None."""
+        entry = self._data.get(profile, {}).get(target)
+        if not entry:
+            return None
+        left, top, right, bottom = entry["bounds"]
+        return (left + right) // 2, (top + bottom) // 2
+
+    def put(self, profile, target, bounds):
+        with self._lock:
+            entry = self._data.setdefault(profile, {}).get(target)
+            if entry and entry["bounds"] == list(bounds):
+                entry["hits"] += 1
+            else:
+                self._data[profile][target] = {"bounds": list(bounds), "hits": 1}
+            self._dirty = True
+
+    def invalidate(self, profile, target):
+        with self._lock:
+            if self._data.get(profile, {}).pop(target, None) is not None:
+                self._dirty = True
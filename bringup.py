@@ -0,0 +1,406 @@
+import sys
+import time
+import traceback
+
+import cancellation
+import checkpoints
+import device_props
+import device_session
+import device_state
+import golden_state
+import journal
+import metrics
+import timing_history
+import trace_export
+from adb_setup import REQUIRED_FILES, SCRIPT_DIR, AdbSetup, script_timeout
+from device_shell import AdbDevice
+from flow_engine import run_flow
+from install_apks import DEFAULT_APKS, run_install_process
+from openvpn_config import OPENVPN_PACKAGE, PREFS_NAME as OPENVPN_PREFS_NAME, ReconnectPrefsStore, configure_openvpn
+from supersu_config import SUPERSU_PACKAGE, configure_supersu, default_grant_works
+
+# End-to-end bring-up of one device in a single process.
+#
+# The ADB setup (connect, mount, APKs, Kandel scripts, reboot) and the UI
+# stages (golden restore, SuperSU, app permissions, OpenVPN) run in order on
+# shared ADB and uiautomator2 sessions. Stages pass on what they learned
+# through the runner's state: freshly installed packages become flow facts
+# (the target app is launched directly instead of from the app drawer),
+# packages restored from the golden bundle skip their UI stage, and the
+# reboot drops the cached device properties and the UI session.
+#
+# Completed stages are checkpointed per device (checkpoints.py). A restarted
+# bring-up re-runs the cheap stages ("resume": "rerun"), re-checks the others
+# on the device and skips them while their checkpoint still holds; from the
+# first stage that has to run again, everything after it runs too.
+#
+# Independently of checkpoints, one batched state probe (device_state.py)
+# tells which stages' postconditions already hold on the device ("done_if":
+# /system already rw, the same APK versions installed, SuperSU and OpenVPN
+# configured, ...); those stages are skipped even on a first run.
+#
+# The script and reboot timeouts, and how often they are polled, are learned
+# from earlier runs on the same device model (timing_history.py).
+#
+# Run under a cancellation token (cancellation.py), a bring-up stops within
+# about a second of the token being cancelled, with self.error saying so.
+
+TARGET_PACKAGE = "az.osmdroidprop"
+
+
+class Bringup:
+    """Runs the bring-up stages for one device; pico_setup.py and the CLI both use it."""
+
+    def __init__(self, ip, adb=None, log=print, on_connected=None, ui_stages=True, script_dir=SCRIPT_DIR,
+                 resume=True, checkpoint_store=None, detached_scripts=True):
+        self.ip = ip
+        self.serial = f"{ip}:5555"
+        self.adb = adb if adb is not None else AdbSetup()
+        self.log = log
+        self.on_connected = on_connected
+        self.ui_stages = ui_stages
+        self.script_dir = script_dir
+        # Run the Kandel scripts detached on the device, so a dropped adb connection doesn't restart them
+        self.detached_scripts = detached_scripts
+        self.state = {"installed": [], "restored": []}
+        self.resume = resume
+        self.checkpoints = checkpoint_store if checkpoint_store is not None else checkpoints.CheckpointStore()
+        self._done = {}
+        self._state_probe = None
+        # Debian rootfs search result (device_state.debian_rootfs), kept until a Kandel script runs
+        self._debian_rootfs = None
+        self.skipped_by_state = set()
+        # Result of the supersu stage's done_if, so stage_supersu doesn't repeat the check
+        self._supersu_grants = None
+        self.apk_versions = device_state.ApkVersionCache()
+        self.timings = timing_history.get_history()
+        # Known once connected
+        self.model = None
+        # (title, message) of the stage that failed
+        self.error = None
+        self.stages = [
+            {"id": "connect", "title": "Connecting to device", "run": self.stage_connect, "resume": "rerun",
+             "error": ("Connection Failed", f"Could not connect to device at {ip}")},
+            {"id": "mount_system", "title": "Mounting /system as read-write", "run": self.stage_mount,
+             "resume": "rerun", "done_if": lambda s: s.system_rw, "error": ("Mount Failed", "Failed to mount /system as read-write")},
+            {"id": "install_apks", "title": "Starting APK installations", "run": self.stage_install_apks,
+             "check": self.check_apks_installed, "keeps": ["installed"],
+             "done_if": self.apks_current, "on_skip": self.keep_installed_packages,
+             "error": ("Install Failed", "APK installation failed.")},
+            {"id": "verify_files", "title": "Verifying required files", "run": self.stage_verify_files,
+             "resume": "rerun", "done_if": self.files_present,
+             "error": ("File Check Failed", "Required files missing on device.\nPlease check the directory and files.")},
+            {"id": "script_1", "title": "Running 1_Kandel_setup.sh", "run": self.stage_script_1,
+             "done_if": lambda s: self.script_completed(s, "1_Kandel_setup.sh"),
+             "error": ("Script Failed", "First setup script failed. Aborting.")},
+            {"id": "reboot", "title": "Rebooting", "run": self.stage_reboot, "check": self.check_rebooted,
+             # Nothing to reboot for if 1_Kandel_setup.sh's work was already on the device
+             "done_if": lambda s: "script_1" in self.skipped_by_state,
+             "error": ("Reboot Failed", "Device did not reboot and reconnect successfully.")},
+            {"id": "script_2", "title": "Running 2_Kandel_setup.sh", "run": self.stage_script_2,
+             "done_if": lambda s: self.script_completed(s, "2_Kandel_setup.sh"),
+             "error": ("Script Failed", "Second setup script failed.")},
+        ]
+        if ui_stages:
+            self.stages += [
+                {"id": "golden_restore", "title": "Restoring golden app state", "run": self.stage_golden_restore,
+                 "resume": "rerun", "error": ("Restore Failed", "Golden app state could not be restored.")},
+                {"id": "supersu", "title": "Configuring SuperSU", "run": self.stage_supersu,
+                 "done_if": lambda s: self.supersu_grants_by_default(),
+                 "error": ("SuperSU Setup Failed", "SuperSU could not be configured.")},
+                {"id": "permissions", "title": "Granting app permissions", "run": self.stage_permissions,
+                 "error": ("Permission Setup Failed", "The app permissions could not be granted.")},
+                {"id": "openvpn", "title": "Configuring OpenVPN", "run": self.stage_openvpn,
+                 "done_if": self.openvpn_configured,
+                 "error": ("OpenVPN Setup Failed", "OpenVPN could not be configured.")},
+            ]
+
+    @property
+    def facts(self):
+        """Flow facts derived from the state of earlier stages."""
+        return {f"installed:{package}" for package in self.state["installed"]}
+
+    def device(self):
+        return device_session.get_device(self.serial)
+
+    def prewarm(self):
+        """Bring up the uiautomator2 agent in the background while ADB steps run."""
+        if self.ui_stages:
+            device_session.get_session(self.serial).prewarm(log=self.log)
+
+    def run(self):
+        """Run every stage in order; on failure return False with self.error set."""
+        start = time.time()
+        if self.resume:
+            self._done = self.checkpoints.completed(self.serial)
+        else:
+            self.checkpoints.clear(self.serial)
+        skipping = bool(self._done)
+        with journal.context(serial=self.serial):
+            journal.event("bringup_start", ip=self.ip, ui_stages=self.ui_stages, resume=skipping)
+            try:
+                for index, stage in enumerate(self.stages):
+                    self.log(f"\n=== {stage['title']} ===")
+                    if "done_if" in stage and stage["done_if"](self.probe()):
+                        self.log("✔ Already set up on the device; skipped.")
+                        self.skipped_by_state.add(stage["id"])
+                        if "on_skip" in stage:
+                            stage["on_skip"]()
+                        journal.event("stage_skipped", step=stage["id"], reason="state")
+                        continue
+                    if skipping and stage.get("resume") != "rerun":
+                        if self.checkpoint_holds(stage):
+                            record = self._done[stage["id"]]
+                            self.log(f"✔ Done at {record['done_at']}; skipped (checkpoint).")
+                            self.state.update(record["state"])
+                            journal.event("stage_skipped", step=stage["id"], reason="checkpoint")
+                            continue
+                        # This stage runs again, so everything after it has to as well
+                        skipping = False
+                        self.checkpoints.drop(self.serial, [s["id"] for s in self.stages[index:]])
+                    stage_start = time.time()
+                    with journal.context(step=stage["id"]):
+                        journal.event("stage_start")
+                        ok = False
+                        try:
+                            ok = stage["run"]()
+                        finally:
+                            journal.event("stage_end", ok=ok, duration=round(time.time() - stage_start, 3))
+                            # The stage changed the device; probe again when next needed
+                            self._state_probe = None
+                    if not ok:
+                        self.error = stage["error"]
+                        self.log(f"Stage '{stage['id']}' failed after {time.time() - stage_start:.1f}s.")
+                        journal.event("bringup_end", ok=False, duration=round(time.time() - start, 3))
+                        return False
+                    if stage.get("resume") != "rerun":
+                        self.record_checkpoint(stage, time.time() - stage_start)
+            except cancellation.Cancelled:
+                # Completed stages keep their checkpoints; the next run resumes from here
+                self.error = ("Setup Stopped", "The setup was stopped before it finished.")
+                self.log(f"\n⏹ Bring-up of {self.serial} stopped after {time.time() - start:.1f}s.")
+                journal.event("bringup_end", ok=False, cancelled=True, duration=round(time.time() - start, 3))
+                return False
+            journal.event("bringup_end", ok=True, duration=round(time.time() - start, 3))
+        self.checkpoints.clear(self.serial)
+        self.log(f"\n=== Bring-up of {self.serial} finished in {time.time() - start:.1f}s ===")
+        return True
+
+    # --- Device state and checkpoints ---
+
+    def shell(self, command):
+        return self.adb.run_adb_command(["-s", self.serial, "shell", command])
+
+    def probe(self):
+        """The device state (device_state.DeviceState); one adb call, repeated after a stage ran."""
+        if self._state_probe is None:
+            self._state_probe = device_state.setup_probe(self.shell, self.script_dir)
+        return self._state_probe
+
+    def script_completed(self, state, script_name):
+        """The script in its current version succeeded here and the Debian rootfs it sets up is present.
+
+        The rootfs search walks /data, so it is only made once a completion
+        record exists and is repeated only after a Kandel script ran.
+        """
+        if script_name not in state.scripts_done:
+            return False
+        if self._debian_rootfs is None:
+            self._debian_rootfs = device_state.debian_rootfs(self.shell)
+        return device_state.debian_installed(self._debian_rootfs)
+
+    def apks_current(self, state):
+        """True if every APK is installed at the version its local file was last installed with."""
+        for apk in DEFAULT_APKS:
+            version = self.apk_versions.get(apk["file"])
+            if version is None or state.versions.get(apk["package"]) != version:
+                return False
+        return True
+
+    def keep_installed_packages(self):
+        self.state["installed"] = [apk["package"] for apk in DEFAULT_APKS]
+
+    def supersu_grants_by_default(self):
+        """SuperSU's Default access = Grant in effect (see supersu_config.default_grant_works)."""
+        self._supersu_grants = default_grant_works(AdbDevice(self.serial))
+        return self._supersu_grants
+
+    def openvpn_configured(self, state):
+        """Profile imported and the continuous retry preference, as learned from OpenVPN itself, set."""
+        reconnect = ReconnectPrefsStore().get(state.versions.get(OPENVPN_PACKAGE))
+        return (state.openvpn_profile_imported and reconnect is not None
+                and state.prefs_match(OPENVPN_PACKAGE, OPENVPN_PREFS_NAME, reconnect))
+
+    def files_present(self, state):
+        return all(f"{self.script_dir}/{name}" in state.files for name in REQUIRED_FILES)
+
+    def checkpoint_holds(self, stage):
+        """True if the stage's checkpoint exists and still holds on the device."""
+        if stage["id"] not in self._done:
+            return False
+        if stage["id"] not in self.probe().markers:
+            return False
+        check = stage.get("check")
+        return check is None or check()
+
+    def record_checkpoint(self, stage, duration):
+        boot_id = self.shell(checkpoints.marker_command(stage["id"]))
+        state = {key: self.state[key] for key in stage.get("keeps", [])}
+        self.checkpoints.mark_done(self.serial, stage["id"], state=state, boot_id=boot_id, duration=duration)
+
+    def check_apks_installed(self):
+        versions = self.probe().versions
+        return all(apk["package"] in versions for apk in DEFAULT_APKS)
+
+    def check_rebooted(self):
+        # The reboot happened if the device booted since 1_Kandel_setup.sh finished
+        boot_id = self.probe().boot_id
+        script_1 = self._done.get("script_1", {})
+        return boot_id is not None and script_1.get("boot_id") not in (None, boot_id)
+
+    # --- ADB stages ---
+
+    def stage_connect(self):
+        if not self.adb.connect_device(self.ip):
+            return False
+        props = device_props.for_serial(self.serial, self.adb.run_adb_command)
+        if props is not None:
+            self.log(f"Device: {props.describe()}")
+            self.model = props.model
+        if self.on_connected:
+            self.on_connected()
+        # The agent's packages install while the ADB stages run (connect
+        # always runs, unlike the stages after it that may be skipped)
+        self.prewarm()
+        return True
+
+    def stage_mount(self):
+        return self.adb.mount_system_rw(serial=self.serial)
+
+    def stage_install_apks(self):
+        self.state["installed"] = run_install_process(self.log, serial=self.serial)
+        # Remember which versions the local APK files are, so the next bring-up can skip them
+        self._state_probe = None
+        versions = self.probe().versions
+        for apk in DEFAULT_APKS:
+            if apk["package"] in self.state["installed"] and apk["package"] in versions:
+                self.apk_versions.put(apk["file"], versions[apk["package"]])
+        self.apk_versions.save()
+        return True
+
+    def stage_verify_files(self):
+        return self.adb.verify_files_exist(self.script_dir)
+
+    def learned_timeout(self, stage_id, default, **limits):
+        """The stage's timeout learned from earlier runs on this model, or the default."""
+        timeout = self.timings.timeout_for(self.model, f"bringup/{stage_id}", default, **limits)
+        if timeout != default:
+            self.log(f"Timeout {timeout:.0f}s, learned from earlier runs on {self.model} (default {default}s).")
+        return timeout
+
+    def learned_poll_interval(self, stage_id, default=5):
+        return self.timings.poll_interval(self.model, f"bringup/{stage_id}", default)
+
+    def run_script(self, stage_id, script_name):
+        self._debian_rootfs = None
+        timeout = self.learned_timeout(stage_id, script_timeout(script_name), margin=60, floor=120)
+        if self.detached_scripts:
+            return self.adb.execute_script_detached(script_name, self.script_dir, self.ip, timeout=timeout,
+                                                    poll_interval=self.learned_poll_interval(stage_id))
+        return self.adb.execute_script(script_name, self.script_dir, self.ip, timeout=timeout)
+
+    def stage_script_1(self):
+        return self.run_script("script_1", "1_Kandel_setup.sh")
+
+    def stage_reboot(self):
+        # The uiautomator2 agent doesn't survive the reboot; restart it once
+        # the device is back, during 2_Kandel_setup.sh.
+        device_session.get_session(self.serial).close()
+        if not self.adb.reboot_device_and_wait(self.ip,
+                                               connect_timeout=self.learned_timeout("reboot", 300, margin=30, floor=60),
+                                               poll_interval=self.learned_poll_interval("reboot")):
+            return False
+        self.prewarm()
+        return True
+
+    def stage_script_2(self):
+        return self.run_script("script_2", "2_Kandel_setup.sh")
+
+    # --- UI stages ---
+
+    def stage_golden_restore(self):
+        if golden_state.latest_bundle() is None:
+            self.log("No golden bundle; apps are configured through their flows.")
+            return True
+        self.state["restored"] = golden_state.restore_packages(self.serial, callback=self.log)
+        return True
+
+    def stage_supersu(self):
+        if SUPERSU_PACKAGE in self.state["restored"]:
+            self.log("SuperSU state restored from the golden bundle.")
+            return True
+        d = self.device()
+        return (configure_supersu(d, log=self.log, grants_by_default=self._supersu_grants)
+                or run_flow("supersu", d, log=self.log, facts=self.facts))
+
+    def stage_permissions(self):
+        state = self.probe()
+        if TARGET_PACKAGE in state.versions and not state.requested.get(TARGET_PACKAGE):
+            self.log(f"No requested permissions could be read for {TARGET_PACKAGE}; granting them in the app.")
+        if state.permissions_granted(TARGET_PACKAGE):
+            self.log("Permissions already granted; launching the app.")
+            self.shell(f"monkey -p {TARGET_PACKAGE} -c android.intent.category.LAUNCHER 1")
+            return True
+        d = self.device()
+        if TARGET_PACKAGE in self.state["restored"]:
+            self.log("Permissions restored from the golden bundle; launching the app.")
+            d.app_start(TARGET_PACKAGE)
+            return True
+        return run_flow("app", d, log=self.log, facts=self.facts)
+
+    def stage_openvpn(self):
+        if OPENVPN_PACKAGE in self.state["restored"]:
+            self.log("OpenVPN state restored from the golden bundle.")
+            return True
+        d = self.device()
+        return configure_openvpn(d, log=self.log) or run_flow("openvpn", d, log=self.log, facts=self.facts)
+
+
+def main(argv):
+    ips = [arg for arg in argv if not arg.startswith("--")]
+    if not ips:
+        print("Usage: python bringup.py <device ip> [<device ip> ...] [--no-ui] [--fresh] [--attached] [--trace=trace.json] [--metrics-port[=N]]")
+        return 2
+    trace_path = next((arg.split("=", 1)[1] for arg in argv if arg.startswith("--trace=")), None)
+    collector = trace_export.TraceCollector().start() if trace_path else None
+    metrics_port = metrics.port_from_args(argv)
+    if metrics_port is not None:
+        metrics.serve(metrics_port)
+        print(f"Metrics on http://127.0.0.1:{metrics_port}/metrics")
+    adb = AdbSetup()
+    failed = []
+    for ip in ips:
+        if not adb.validate_ip(ip):
+            print(f"Invalid IP address: {ip}")
+            failed.append(ip)
+            continue
+        bringup = Bringup(ip, adb=adb, ui_stages="--no-ui" not in argv, resume="--fresh" not in argv,
+                          detached_scripts="--attached" not in argv)
+        try:
+            ok = bringup.run()
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+            traceback.print_exc()
+            ok = False
+        if not ok:
+            if bringup.error:
+                print(f"❌ {ip}: {bringup.error[0]}: {bringup.error[1]}")
+            failed.append(ip)
+    device_session.close_all()
+    if collector is not None:
+        print(f"Timeline written to {collector.export(trace_path)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,160 @@
+import contextlib
+import subprocess
+import threading
+import time
+
+# Cooperative cancellation of a device's bring-up.
+#
+# The thread running a bring-up works under a CancelToken (scope()). Every
+# adb command goes through run() (via journal.run), which kills the command
+# as soon as the token is cancelled; time.sleep on that thread returns early;
+# and the uiautomator2 proxy checks the token before each call. All of them
+# then raise Cancelled, which unwinds the stages like KeyboardInterrupt does,
+# so the GUI's Stop button frees the device within about a second instead of
+# after the remaining timeouts.
+#
+# A uiautomator2 call already in flight runs to completion; only the next one
+# raises. Work that outlives its adb call on the device (a detached Kandel
+# script, a tap script inside d.shell) registers a kill command with
+# on_cancel(), which cancel() starts on the device.
+
+_real_sleep = time.sleep
+_hook_lock = threading.Lock()
+_local = threading.local()
+
+
+class Cancelled(BaseException):
+    """The work was stopped. A BaseException, so `except Exception` handlers let it through."""
+
+
+class CancelToken:
+    """Cancellation flag of one device's run, with the subprocesses to kill on cancel()."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        if self._event.wait(max(seconds, 0)):
+            raise Cancelled()
+
+    def add_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+        # cancel() may have run before the process was registered
+        if self._event.is_set():
+            process.kill()
+
+    def discard_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+class _CommandOnCancel:
+    """Registered like a process: kill() starts the command without waiting for it."""
+
+    def __init__(self, command):
+        self.command = command
+
+    def kill(self):
+        subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
+
+
+def current():
+    """The token of this thread's scope(), or None."""
+    return getattr(_local, "token", None)
+
+
+def check():
+    token = current()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds):
+    """time.sleep that ends early (raising Cancelled) when this thread's token is cancelled."""
+    token = current()
+    if token is None:
+        _real_sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def install_sleep_hook():
+    """Route time.sleep (for every module using `time.sleep(...)`) through sleep()."""
+    with _hook_lock:
+        if time.sleep is _real_sleep:
+            time.sleep = sleep
+
+
+@contextlib.contextmanager
+def scope(token):
+    """Run the block of this thread under the token."""
+    install_sleep_hook()
+    previous = current()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+@contextlib.contextmanager
+def on_cancel(command):
+    """Start the command (e.g. an adb shell kill) if this thread's token is cancelled during the block."""
+    token = current()
+    if token is None:
+        yield
+        return
+    killer = _CommandOnCancel(command)
+    token.add_process(killer)
+    try:
+        yield
+    finally:
+        token.discard_process(killer)
+
+
+def run(command, input=None, timeout=None, check=False, **kwargs):
+    """subprocess.run() that kills the command when this thread's token is cancelled."""
+    token = current()
+    if token is None:
+        return subprocess.run(command, input=input, timeout=timeout, check=check, **kwargs)
+    token.check()
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    with subprocess.Popen(command, **kwargs) as process:
+        token.add_process(process)
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(process.args, timeout, output=stdout, stderr=stderr)
+        finally:
+            token.discard_process(process)
+    token.check()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, process.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
@@ -0,0 +1,62 @@
+import os
+import time
+
+from json_store import JsonStore
+
+# Per-device checkpoints of the bring-up stages.
+#
+# Each completed stage is recorded per serial in pico_state/checkpoints.json,
+# with what it produced (e.g. the installed packages) and the device's boot
+# id at the time, and a marker file is left on the device itself. When a
+# bring-up is restarted after a failure, stages whose checkpoint still holds
+# on the device (marker present, packages still installed, reboot happened)
+# are skipped, so a failure in 2_Kandel_setup.sh doesn't cost the APK
+# installs and the 10 minute first script again. The markers and the boot id
+# are read by the device state probe (device_state.py).
+
+CHECKPOINT_FILE = os.path.join("pico_state", "checkpoints.json")
+
+# Directory on the device holding one marker file per completed stage
+DEVICE_MARKER_DIR = "/data/local/tmp/pico_checkpoints"
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+
+class CheckpointStore(JsonStore):
+    """Persistent completed-stage records, keyed by device serial."""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        super().__init__(path)
+
+    def completed(self, serial):
+        """{stage id: record} of the stages completed on this device."""
+        return dict(self._data.get(serial, {}))
+
+    def mark_done(self, serial, stage_id, state=None, boot_id=None, duration=None):
+        with self._lock:
+            self._data.setdefault(serial, {})[stage_id] = {
+                "done_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "duration": round(duration, 1) if duration is not None else None,
+                "boot_id": boot_id,
+                "state": state or {},
+            }
+            self._dirty = True
+        # A checkpoint is only useful if it survives the crash that follows it
+        self.save()
+
+    def drop(self, serial, stage_ids):
+        with self._lock:
+            stages = self._data.get(serial, {})
+            for stage_id in stage_ids:
+                if stages.pop(stage_id, None) is not None:
+                    self._dirty = True
+
+    def clear(self, serial):
+        with self._lock:
+            if self._data.pop(serial, None) is not None:
+                self._dirty = True
+        self.save()
+
+
+def marker_command(stage_id):
+    """Shell command leaving the device-side marker of a completed stage; prints the boot id."""
+    return f"mkdir -p {DEVICE_MARKER_DIR} && date > {DEVICE_MARKER_DIR}/{stage_id} && cat {BOOT_ID}"
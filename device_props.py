@@ -0,0 +1,201 @@
+import re
+import subprocess
+import threading
+import time
+
+import journal
+
+# Per-serial cache of device properties.
+#
+# Model, Android version, locale, launcher package and display size are read
+# once per device session: one batched shell call (all of getprop, the HOME
+# activity resolver and the boot id) plus a single d.info for the display.
+# The ADB setup (pico_setup.py) and the uiautomator2 flows read the same
+# entry, so decisions that depend on device identity cost no round trips.
+# An entry is dropped when the device reboots and its display part when the
+# screen rotates. Reboots nobody told us about are caught by comparing the
+# boot id, at most every BOOT_CHECK_INTERVAL seconds per device.
+
+SEPARATOR = "--8<--"
+
+BOOT_ID_COMMAND = "cat /proc/sys/kernel/random/boot_id"
+
+PROBE_SCRIPT = (
+    f"getprop; echo '{SEPARATOR}'; "
+    "cmd package resolve-activity --brief -a android.intent.action.MAIN "
+    f"-c android.intent.category.HOME 2>/dev/null; echo '{SEPARATOR}'; "
+    f"{BOOT_ID_COMMAND}"
+)
+
+# Seconds a cached entry is trusted before its boot id is read again
+BOOT_CHECK_INTERVAL = 30
+
+# Locale properties, most specific first
+LOCALE_PROPS = ["persist.sys.locale", "ro.product.locale",
+                "persist.sys.language", "ro.product.locale.language"]
+
+_GETPROP_RE = re.compile(r"^\[([^\]]+)\]: \[(.*)\]$")
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def parse_getprop(output):
+    """Parse `getprop` output ("[key]: [value]" lines) into a dict."""
+    props = {}
+    for line in output.splitlines():
+        m = _GETPROP_RE.match(line.strip())
+        if m:
+            props[m.group(1)] = m.group(2)
+    return props
+
+
+class DeviceProps:
+    """Properties of one device, as read by PROBE_SCRIPT (and d.info for the display)."""
+
+    def __init__(self, serial, props, launcher="unknown", boot_id=""):
+        self.serial = serial
+        self.props = props
+        self.launcher = launcher
+        self.boot_id = boot_id
+        self.display_size = None
+        self.rotation = None
+        self.checked_at = time.time()
+
+    @classmethod
+    def parse(cls, serial, output):
+        sections = output.split(SEPARATOR) + ["", ""]
+        launcher = "unknown"
+        resolved = sections[1].strip().splitlines()
+        if resolved and "/" in resolved[-1]:
+            launcher = resolved[-1].split("/")[0]
+        return cls(serial, parse_getprop(sections[0]), launcher, sections[2].strip())
+
+    def get(self, name, default=""):
+        return self.props.get(name, default)
+
+    @property
+    def model(self):
+        return self.get("ro.product.model", "unknown")
+
+    @property
+    def android_version(self):
+        return self.get("ro.build.version.release", "unknown")
+
+    @property
+    def sdk(self):
+        try:
+            return int(self.get("ro.build.version.sdk", "0"))
+        except ValueError:
+            return 0
+
+    def locales(self):
+        """Locale property values, most specific first (empty ones skipped)."""
+        return [self.get(name) for name in LOCALE_PROPS if self.get(name)]
+
+    def profile(self):
+        """Model, Android version and launcher: the key of the learned selector order."""
+        return "|".join([self.model, self.android_version, self.launcher])
+
+    def set_display(self, info):
+        """Store the display part of a uiautomator2 d.info."""
+        self.display_size = (info["displayWidth"], info["displayHeight"])
+        self.rotation = info.get("displayRotation")
+
+    def rotated(self, rotation):
+        """Forget the display size after the screen rotated."""
+        if rotation != self.rotation:
+            self.display_size = None
+            self.rotation = rotation
+
+    def describe(self):
+        return f"{self.model} (Android {self.android_version}, SDK {self.sdk}), launcher {self.launcher}"
+
+
+def device_serial(d):
+    return getattr(d, "serial", None) or "default"
+
+
+def _store(props):
+    with _lock:
+        _cache[props.serial] = props
+    return props
+
+
+def cached(serial):
+    with _lock:
+        return _cache.get(serial)
+
+
+def _still_booted(props, read_boot_id):
+    """False if the device rebooted since props were read (its entry is then dropped).
+
+    read_boot_id() -> the current boot id, or None if it can't be read; the
+    entry is kept then.
+    """
+    if time.time() - props.checked_at < BOOT_CHECK_INTERVAL:
+        return True
+    boot_id = read_boot_id()
+    if boot_id is None:
+        return True
+    if boot_id.strip() != props.boot_id:
+        invalidate(props.serial)
+        return False
+    props.checked_at = time.time()
+    return True
+
+
+def _device_boot_id(d):
+    """The boot id over the device's shell, or None if the call fails."""
+    try:
+        result = d.shell(["sh", "-c", BOOT_ID_COMMAND])
+    except Exception:
+        return None
+    return result.output if result.exit_code == 0 else None
+
+
+def for_device(d):
+    """Properties of a uiautomator2 device: one shell call and one d.info per session."""
+    props = cached(device_serial(d))
+    if props is not None and not _still_booted(props, lambda: _device_boot_id(d)):
+        props = None
+    if props is None:
+        output = d.shell(["sh", "-c", PROBE_SCRIPT]).output
+        props = _store(DeviceProps.parse(device_serial(d), output))
+    if props.display_size is None:
+        props.set_display(d.info)
+    return props
+
+
+def _run_adb(command, adb_path="adb", timeout=15):
+    try:
+        result = journal.run([adb_path] + command, capture_output=True, text=True,
+                             timeout=timeout, check=True)
+        return result.stdout
+    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, OSError):
+        return None
+
+
+def for_serial(serial, run_adb=None):
+    """Properties of a device by adb serial; None if it can't be reached.
+
+    run_adb(command) -> output or None lets the caller use its own adb wrapper
+    (e.g. PicoSetupApp.run_adb_command, which logs failures).
+    """
+    run_adb = run_adb or _run_adb
+    props = cached(serial)
+    if props is not None and _still_booted(props, lambda: run_adb(["-s", serial, "shell", BOOT_ID_COMMAND])):
+        return props
+    output = run_adb(["-s", serial, "shell", PROBE_SCRIPT])
+    if not output:
+        return None
+    return _store(DeviceProps.parse(serial, output))
+
+
+def invalidate(serial=None):
+    """Drop the cached properties of one device (e.g. after a reboot) or of all."""
+    with _lock:
+        if serial is None:
+            _cache.clear()
+        else:
+            _cache.pop(serial, None)
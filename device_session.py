@@ -0,0 +1,164 @@
+import contextlib
+import threading
+import time
+
+from instrumented_device import InstrumentedDevice
+
+# Lazy, shared uiautomator2 sessions.
+#
+# Connecting (and starting the on-device uiautomator agent) is the most
+# expensive part of a short flow. Sessions are created on first use, one per
+# serial per process, and every flow run in the process gets the same one. A
+# keep-alive thread pings the agent while the session is idle so it is still
+# running when the next flow starts. prewarm() does the connection in the
+# background, so the bring-up can overlap it with slow ADB steps. While a tap
+# script has the agent stopped (agent_paused()), the keep-alive leaves it
+# alone; it is started again afterwards. Devices are handed out wrapped in
+# InstrumentedDevice, which journals every agent call. Every flow of the
+# bring-up gets the same device, so callers pass timeouts per call instead of
+# changing device-wide settings such as the implicit wait.
+
+KEEPALIVE_INTERVAL = 60.0
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class DeviceSession:
+    """One uiautomator2 connection, opened on first use and kept warm."""
+
+    def __init__(self, serial=None, keepalive_interval=KEEPALIVE_INTERVAL, log=print):
+        self.serial = serial
+        self.keepalive_interval = keepalive_interval
+        self.log = log
+        self._device = None
+        self._connect_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._prewarm = None
+        self._paused = threading.Event()
+
+    @property
+    def device(self):
+        """The connected device, connecting on first use."""
+        if self._device is None:
+            with self._connect_lock:
+                if self._device is None:
+                    import uiautomator2 as u2
+                    device = u2.connect(self.serial) if self.serial else u2.connect()
+                    self._device = InstrumentedDevice(device, self.serial)
+                    self.start_keepalive()
+        return self._device
+
+    @property
+    def connected(self):
+        return self._device is not None
+
+    def healthy(self):
+        """One agent round trip; False if the agent doesn't answer."""
+        if self._device is None:
+            return False
+        try:
+            self._device.info
+            return True
+        except Exception:
+            return False
+
+    def prewarm(self, log=None):
+        """Connect and start the agent (installing it if needed) in a background thread."""
+        if self._prewarm is not None and self._prewarm.is_alive():
+            return self._prewarm
+        log = log or self.log
+
+        def warm():
+            start = time.time()
+            try:
+                self.device
+                ready = self.healthy()
+            except Exception as e:
+                log(f"   ⚠️ uiautomator2 pre-warm failed: {e}")
+                return
+            state = "ready" if ready else "not answering"
+            log(f"   uiautomator2 agent {state} after {time.time() - start:.1f}s (pre-warmed in background)")
+
+        self._prewarm = threading.Thread(target=warm, name="u2-prewarm", daemon=True)
+        self._prewarm.start()
+        return self._prewarm
+
+    def wait_ready(self, timeout=None):
+        """Wait for a running pre-warm to finish; True if the agent answers."""
+        if self._prewarm is not None:
+            self._prewarm.join(timeout)
+        return self.healthy()
+
+    @contextlib.contextmanager
+    def agent_paused(self):
+        """Block during which the agent is stopped on purpose; restart it in the background afterwards.
+
+        A keep-alive ping would start the agent again mid-block, so the
+        keep-alive skips its pings until the block ends.
+        """
+        self._paused.set()
+        try:
+            yield self
+        finally:
+            self._paused.clear()
+            if self._device is not None:
+                self.prewarm()
+
+    def reconnect(self):
+        with self._connect_lock:
+            self._device = None
+        return self.device
+
+    def _keepalive(self):
+        while not self._stop.wait(self.keepalive_interval):
+            if self._device is not None and not self._paused.is_set() and not self.healthy():
+                self.log("   ⚠️ uiautomator2 agent did not answer; reconnecting on next use.")
+                with self._connect_lock:
+                    self._device = None
+
+    def start_keepalive(self):
+        if self.keepalive_interval and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._keepalive, name="u2-keepalive", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        # A pre-warm still connecting would hand back a stale device afterwards.
+        if self._prewarm is not None:
+            self._prewarm.join(timeout=30)
+            self._prewarm = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        self._device = None
+
+
+def get_session(serial=None):
+    """The process-wide session for a serial (None = the default device)."""
+    with _lock:
+        session = _sessions.get(serial)
+        if session is None:
+            session = _sessions[serial] = DeviceSession(serial)
+        return session
+
+
+def get_device(serial=None):
+    return get_session(serial).device
+
+
+def session_of(d):
+    """The session that handed out device d, or None for a device connected some other way."""
+    with _lock:
+        sessions = list(_sessions.values())
+    return next((session for session in sessions if session._device is not None and session._device is d), None)
+
+
+def close_all():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,79 @@
+import collections
+import re
+import shlex
+
+import journal
+
+# Shell helpers shared by the modules that read or change device state
+# directly rather than through the UI.
+#
+# su() and has_root() work on anything with a uiautomator2-style
+# shell(command, timeout) returning (output, exit_code): a u2 device for the
+# fast-path configurators (root_prefs.py and its users), or an AdbDevice for
+# code that only has an adb serial (golden_state.py). The `dumpsys package`
+# parsers serve the state probe (device_state.py), the golden bundles and the
+# OpenVPN fast path alike.
+
+ShellResult = collections.namedtuple("ShellResult", ["output", "exit_code"])
+
+_VERSION_RE = re.compile(r"versionCode=(\d+)")
+_REQUESTED_RE = re.compile(r"^\s*(android\.permission\.\w+)\s*$")
+_GRANTED_RE = re.compile(r"^\s*([\w.]+): granted=true")
+
+
+class AdbDevice:
+    """The shell() of a uiautomator2 device over plain `adb shell`, for a serial."""
+
+    def __init__(self, serial=None, adb_path="adb"):
+        self.serial = serial
+        self.adb_path = adb_path
+
+    def shell(self, command, timeout=60):
+        if not isinstance(command, str):
+            command = " ".join(shlex.quote(part) for part in command)
+        result = journal.run([self.adb_path] + (["-s", self.serial] if self.serial else []) + ["shell", command],
+                             capture_output=True, text=True, timeout=timeout)
+        return ShellResult(result.stdout, result.returncode)
+
+
+def su(d, command, timeout=60):
+    """Run a shell command as root; return (output, exit code)."""
+    result = d.shell(["su", "-c", command], timeout=timeout)
+    return result.output, result.exit_code
+
+
+def has_root(d):
+    output, _ = su(d, "id", timeout=15)
+    return "uid=0" in output
+
+
+def version_code(dumpsys_output):
+    """versionCode from `dumpsys package <package>` output, or None if not installed."""
+    m = _VERSION_RE.search(dumpsys_output or "")
+    return int(m.group(1)) if m else None
+
+
+def requested_permissions(dumpsys_output):
+    """The android.permission.* entries of the "requested permissions:" list."""
+    return {m.group(1) for m in map(_REQUESTED_RE.match, (dumpsys_output or "").splitlines()) if m}
+
+
+def granted_permissions(dumpsys_output):
+    """Granted runtime permissions from `dumpsys package <package>` output.
+
+    Only the "runtime permissions:" section counts; install-time permissions
+    are granted with the install and can't be restored with `pm grant`.
+    """
+    granted, in_runtime = set(), False
+    for line in (dumpsys_output or "").splitlines():
+        if "runtime permissions:" in line:
+            in_runtime = True
+            continue
+        if in_runtime:
+            if "granted=" not in line:
+                in_runtime = False
+                continue
+            m = _GRANTED_RE.match(line)
+            if m:
+                granted.add(m.group(1))
+    return granted
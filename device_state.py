@@ -0,0 +1,239 @@
+import os
+import sys
+
+import root_prefs
+from adb_setup import REQUIRED_FILES, SCRIPT_DIR, script_done_path
+from checkpoints import BOOT_ID, DEVICE_MARKER_DIR
+from device_props import SEPARATOR
+from device_shell import granted_permissions, requested_permissions, version_code
+from install_apks import DEFAULT_APKS
+from json_store import JsonStore
+from openvpn_config import DEVICE_PROFILE, OPENVPN_PACKAGE, PREFS_NAME as OPENVPN_PREFS_NAME
+from supersu_config import SUPERSU_PACKAGE
+
+# One-shot probe of what is already set up on a device.
+#
+# A single adb shell call reports the /system mount flags, the versions and
+# granted permissions of the installed packages, which of the setup files
+# exist, OpenVPN's preferences, whether the OpenVPN profile is imported, the
+# bring-up checkpoint markers, the boot id and which Kandel scripts completed
+# in their current version. The bring-up skips every stage whose postcondition
+# already holds, so re-running it on a half-provisioned device costs seconds.
+# The search for the Debian root filesystem the Kandel scripts unpack walks
+# /data, so it is a separate call (debian_rootfs) made only when needed.
+
+KANDEL_SCRIPTS = ["1_Kandel_setup.sh", "2_Kandel_setup.sh"]
+
+# debian_stretch_rootfs_release_*.tgz unpacks Debian 9
+DEBIAN_RELEASE = "9."
+# Where a Debian root filesystem (its etc/debian_version) is looked for
+DEBIAN_SEARCH_ROOTS = ["/data", "/mnt/media_rw"]
+DEBIAN_SEARCH_DEPTH = 5
+# App data and the emulated storage are big and never hold the rootfs
+DEBIAN_SEARCH_PRUNE = ["/data/data", "/data/app", "/data/media", "/data/user", "/data/user_de"]
+
+# Runtime permissions the app flow grants (camera, location, microphone,
+# phone, storage); the ones the app requests must all be granted.
+TARGET_PERMISSIONS = [
+    "android.permission.CAMERA",
+    "android.permission.ACCESS_FINE_LOCATION",
+    "android.permission.ACCESS_COARSE_LOCATION",
+    "android.permission.RECORD_AUDIO",
+    "android.permission.READ_PHONE_STATE",
+    "android.permission.CALL_PHONE",
+    "android.permission.READ_EXTERNAL_STORAGE",
+    "android.permission.WRITE_EXTERNAL_STORAGE",
+]
+
+APK_VERSIONS_FILE = os.path.join("pico_state", "apk_versions.json")
+
+
+
+def _scripts_section(scripts, script_dir):
+    # A script counts as done if its completion record is the md5sum of the script as it is now
+    checks = "; ".join(f"d=$(cat {script_done_path(name)} 2>/dev/null); "
+                       f"[ -n \"$d\" ] && [ \"$d\" = \"$(md5sum {script_dir}/{name} 2>/dev/null)\" ] && echo {name}"
+                       for name in scripts)
+    return f"su -c '{checks}'" if checks else "true"
+
+
+def _debian_section():
+    prune = " -o ".join(f"-path {path}" for path in DEBIAN_SEARCH_PRUNE)
+    find = (f"find {' '.join(DEBIAN_SEARCH_ROOTS)} -maxdepth {DEBIAN_SEARCH_DEPTH} \\( {prune} \\) -prune "
+            f"-o -path \"*/etc/debian_version\" -print 2>/dev/null")
+    return f"su -c '{find} | while read f; do echo \"$f $(cat $f)\"; done'"
+
+
+def probe_script(packages, files, prefs, openvpn_profile=None, openvpn_package=None,
+                 scripts=(), script_dir=SCRIPT_DIR):
+    """The shell script behind DeviceState.probe; one section per SEPARATOR."""
+    sep = f"echo '{SEPARATOR}'"
+    sections = [
+        "grep ' /system ' /proc/mounts",
+        "; ".join(f"echo '@@{p}'; dumpsys package {p} | grep -E 'versionCode=|permission'"
+                  for p in packages) or "true",
+        "; ".join(f"[ -e '{f}' ] && echo '{f}'" for f in files) or "true",
+        "; ".join(f"echo '@@{package}/{name}'; su -c 'cat {root_prefs.prefs_path(package, name)}' 2>/dev/null"
+                  for package, name in prefs) or "true",
+        (f"r=$(grep -m1 '^ *remote ' {openvpn_profile} 2>/dev/null | awk '{{print $2}}'); "
+         f"[ -n \"$r\" ] && su -c \"grep -rlF $r /data/data/{openvpn_package}\" 2>/dev/null | head -1"
+         if openvpn_profile else "true"),
+        f"ls {DEVICE_MARKER_DIR} 2>/dev/null",
+        f"cat {BOOT_ID}",
+        _scripts_section(scripts, script_dir),
+    ]
+    return f"; {sep}; ".join(sections)
+
+
+def _by_header(text):
+    """{name: lines} of '@@name' headed blocks."""
+    blocks, current = {}, None
+    for line in text.splitlines():
+        if line.startswith("@@"):
+            current = blocks.setdefault(line[2:].strip(), [])
+        elif current is not None:
+            current.append(line)
+    return blocks
+
+
+class DeviceState:
+    """Parsed result of the state probe."""
+
+    def __init__(self, system_rw=False, versions=None, requested=None, granted=None, files=(),
+                 prefs=None, openvpn_profile_imported=False, markers=(), boot_id=None, scripts_done=()):
+        self.system_rw = system_rw
+        self.versions = versions or {}
+        self.requested = requested or {}
+        self.granted = granted or {}
+        self.files = set(files)
+        self.prefs = prefs or {}
+        self.openvpn_profile_imported = openvpn_profile_imported
+        self.markers = set(markers)
+        self.boot_id = boot_id
+        self.scripts_done = set(scripts_done)
+
+    @classmethod
+    def parse(cls, output):
+        parts = (output or "").split(SEPARATOR)
+        parts += [""] * (8 - len(parts))
+        mounts, packages, files, prefs, openvpn, markers, boot_id, scripts = parts[:8]
+
+        options = mounts.split()[3].split(",") if len(mounts.split()) > 3 else []
+        versions, requested, granted = {}, {}, {}
+        for package, lines in _by_header(packages).items():
+            text = "\n".join(lines)
+            version = version_code(text)
+            if version is not None:
+                versions[package] = version
+            requested[package] = requested_permissions(text)
+            granted[package] = granted_permissions(text)
+        parsed_prefs = {}
+        for key, lines in _by_header(prefs).items():
+            xml_text = "\n".join(lines)
+            try:
+                parsed_prefs[key] = root_prefs.parse_prefs(xml_text) if "<map" in xml_text else {}
+            except Exception:
+                parsed_prefs[key] = {}
+        return cls(system_rw="rw" in options, versions=versions, requested=requested, granted=granted,
+                   files=files.split(), prefs=parsed_prefs, openvpn_profile_imported=bool(openvpn.strip()),
+                   markers=markers.split(), boot_id=boot_id.strip() or None, scripts_done=scripts.split())
+
+    def prefs_match(self, package, name, expected):
+        values = self.prefs.get(f"{package}/{name}", {})
+        return all(values.get(key) == value for key, value in expected.items())
+
+    def permissions_granted(self, package, permissions=TARGET_PERMISSIONS):
+        """True if the package is installed and every one of these permissions it requests is granted.
+
+        False if it requests none of them: for the app that is expected to
+        request them, that means the dumpsys section wasn't read, not that
+        there is nothing to grant.
+        """
+        if package not in self.versions:
+            return False
+        wanted = self.requested.get(package, set()) & set(permissions)
+        return bool(wanted) and wanted <= self.granted.get(package, set())
+
+
+def probe(run_shell, packages=(), files=(), prefs=(), openvpn_profile=None, openvpn_package=None,
+          scripts=(), script_dir=SCRIPT_DIR):
+    """Run the probe with run_shell(command) -> output (None on failure); a DeviceState."""
+    script = probe_script(packages, files, prefs, openvpn_profile, openvpn_package, scripts, script_dir)
+    return DeviceState.parse(run_shell(script))
+
+
+def setup_probe(run_shell, script_dir=SCRIPT_DIR):
+    """Probe everything the bring-up stages set up."""
+    return probe(
+        run_shell,
+        packages=[apk["package"] for apk in DEFAULT_APKS] + [SUPERSU_PACKAGE],
+        files=[f"{script_dir}/{name}" for name in REQUIRED_FILES],
+        prefs=[(OPENVPN_PACKAGE, OPENVPN_PREFS_NAME)],
+        openvpn_profile=DEVICE_PROFILE,
+        openvpn_package=OPENVPN_PACKAGE,
+        scripts=KANDEL_SCRIPTS,
+        script_dir=script_dir,
+    )
+
+
+def debian_rootfs(run_shell):
+    """{rootfs etc/debian_version path: Debian version} of the Debian root filesystems on the device."""
+    output = run_shell(_debian_section()) or ""
+    return dict(line.split(None, 1) for line in output.splitlines() if len(line.split()) == 2)
+
+
+def debian_installed(rootfs):
+    """True if one of the root filesystems from debian_rootfs() is the Debian release the scripts unpack."""
+    return any(version.startswith(DEBIAN_RELEASE) for version in rootfs.values())
+
+
+class ApkVersionCache(JsonStore):
+    """versionCode of each local APK file, learned when it was last installed."""
+
+    def __init__(self, path=APK_VERSIONS_FILE):
+        super().__init__(path)
+
+    @staticmethod
+    def _stamp(apk_file):
+        st = os.stat(apk_file)
+        return [st.st_size, int(st.st_mtime)]
+
+    def get(self, apk_file):
+        """The versionCode of this APK file, or None if unknown or the file changed since."""
+        entry = self._data.get(apk_file)
+        try:
+            if entry and entry["stamp"] == self._stamp(apk_file):
+                return entry["versionCode"]
+        except OSError:
+            pass
+        return None
+
+    def put(self, apk_file, version):
+        try:
+            stamp = self._stamp(apk_file)
+        except OSError:
+            return
+        with self._lock:
+            self._data[apk_file] = {"stamp": stamp, "versionCode": version}
+            self._dirty = True
+
+
+if __name__ == "__main__":
+    from device_props import _run_adb
+    if len(sys.argv) < 2:
+        print("Usage: python device_state.py <serial>")
+        sys.exit(2)
+    serial = sys.argv[1]
+    run_shell = lambda command: _run_adb(["-s", serial, "shell", command], timeout=60)
+    state = setup_probe(run_shell)
+    print(f"/system read-write: {state.system_rw}")
+    print(f"Package versions: {state.versions}")
+    for package, granted in state.granted.items():
+        print(f"Granted to {package}: {sorted(granted)}")
+    print(f"Files present: {sorted(state.files)}")
+    for key, values in state.prefs.items():
+        print(f"Preferences {key}: {values}")
+    print(f"OpenVPN profile imported: {state.openvpn_profile_imported}")
+    print(f"Checkpoint markers: {sorted(state.markers)}; boot id {state.boot_id}")
+    print(f"Kandel scripts completed: {sorted(state.scripts_done)}")
+    print(f"Debian root filesystems: {debian_rootfs(run_shell) or 'none'}")
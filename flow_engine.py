@@ -0,0 +1,487 @@
+import json
+import os
+import sys
+import time
+import traceback
+
+import device_props
+import journal
+import rpc_accounting
+from bounds_cache import BoundsCache, bounds_profile
+from device_session import get_device
+from popup_watcher import PopupWatcher
+from screen_state import load_screens
+from selector_cache import SelectorOrderCache, device_profile
+from tap_script import TapRecorder, TapScriptStore, compile_script, run_script
+from timing_history import get_history
+from ui_locale import LocaleTexts, device_language
+from ui_runtime import UiRuntime, target_selectors
+
+# Declarative UI flows: step definitions live in flows/<name>.json and are
+# interpreted on the shared UiRuntime, so app.py, openvpn.py and supersu.py
+# all run on the same snapshot-based helpers. Wait timeouts of
+# steps that have run often enough on a device model are learned from their
+# durations there (timing_history.py).
+
+FLOWS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows")
+
+# Popup types that end a handle_popups step once actioned
+CRITICAL_TYPES = ["confirm", "confirm_alt", "no thanks", "allow", "ok"]
+
+
+def load_flow(name_or_path):
+    """Load a flow definition by name (flows/<name>.json) or by path."""
+    path = name_or_path
+    if not os.path.isfile(path):
+        path = os.path.join(FLOWS_DIR, f"{name_or_path}.json")
+    with open(path, encoding="utf-8") as f:
+        flow = json.load(f)
+    flow.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return flow
+
+
+def popup_selector(popup_info):
+    """Build a selector from a popup definition (same keys as the legacy scripts)."""
+    for key in ("textMatches", "text", "resourceId"):
+        if key in popup_info:
+            return {key: popup_info[key]}
+    return None
+
+
+class FlowEngine:
+    """Runs flow step definitions against one device."""
+
+    def __init__(self, d, log=print, selector_cache=None, bounds_cache=None, tap_scripts=None, facts=(),
+                 timings=None):
+        self.d = d
+        self.log = log
+        # Facts passed in by the caller (e.g. "installed:<package>" from the
+        # bring-up runner); steps can depend on them with "when" / "unless".
+        self.facts = set(facts)
+        self.runtime = UiRuntime(d, log=log)
+        self.selector_cache = selector_cache if selector_cache is not None else SelectorOrderCache()
+        self.bounds_cache = bounds_cache if bounds_cache is not None else BoundsCache()
+        self.tap_scripts = tap_scripts if tap_scripts is not None else TapScriptStore()
+        self.timings = timings if timings is not None else get_history()
+        self._flow_name = None
+        self._profile = None
+        self._screens = None
+        self._texts = None
+        self.popup_watcher = PopupWatcher(self.runtime, log=log)
+        self.actions = {
+            "navigate": self.step_navigate,
+            "click_any": self.step_click_any,
+            "handle_popups": self.step_handle_popups,
+            "scroll_find": self.step_scroll_find,
+            "toggle": self.step_toggle,
+            "assert": self.step_assert,
+            "repeat": self.step_repeat,
+        }
+
+    def run(self, flow):
+        """Run a whole flow; return True if every mandatory step succeeded."""
+        if isinstance(flow, str):
+            flow = load_flow(flow)
+        flow = self.texts().resolve(flow)
+        serial = device_props.device_serial(self.d)
+        with journal.context(serial=serial, flow=flow["name"]), \
+                rpc_accounting.accounting(flow["name"], serial, log=self.log):
+            return self._run(flow)
+
+    def _run(self, flow):
+        self.log(f"🚀 Starting flow '{flow['name']}'...")
+        self._flow_name = flow["name"]
+        journal.event("flow_start")
+        start = time.time()
+        use_script = flow.get("tap_script", False)
+        ok = False
+        try:
+            if use_script and self.run_tap_script(flow["name"]):
+                ok = True
+            else:
+                self.runtime.recorder = TapRecorder(self.current_state()) if use_script else None
+                if flow.get("popup_watcher", True):
+                    self.popup_watcher.start()
+                ok = self.run_steps(flow["steps"])
+        finally:
+            self.popup_watcher.stop()
+            if ok:
+                self.keep_recording(flow["name"])
+            self.runtime.recorder = None
+            self.selector_cache.save()
+            self.bounds_cache.save()
+            self.tap_scripts.save()
+        duration = time.time() - start
+        journal.event("flow_end", ok=ok, duration=round(duration, 3))
+        if ok:
+            self.log(f"\n✅ Flow '{flow['name']}' finished successfully in {duration:.1f}s.")
+        else:
+            self.log(f"\n❌ Flow '{flow['name']}' FAILED after {duration:.1f}s.")
+        return ok
+
+    def run_steps(self, steps):
+        for step in steps:
+            if not self.run_step(step):
+                return False
+        return True
+
+    def run_step(self, step):
+        step_id = step.get("id", step["action"])
+        handler = self.actions.get(step["action"])
+        if handler is None:
+            raise ValueError(f"Unknown flow action '{step['action']}' in step '{step_id}'")
+        if "when" in step and step["when"] not in self.facts:
+            return True
+        if "unless" in step and step["unless"] in self.facts:
+            self.log(f"\n⏭️ Step '{step_id}' skipped ({step['unless']})")
+            return True
+
+        self.log(f"\n▶️ Step '{step_id}' ({step['action']})")
+        start = time.time()
+        with journal.context(step=step_id), self.popup_watcher.busy():
+            journal.event("step_start", action=step["action"])
+            error = None
+            try:
+                ok = handler(step)
+            except Exception as e:
+                self.log(f"❗ Step '{step_id}' raised: {e}")
+                ok, error = False, str(e)
+            journal.event("step_end", ok=ok, duration=round(time.time() - start, 3), error=error)
+
+        if ok:
+            return True
+        if step.get("optional", False):
+            self.log(f"   ⚠️ Optional step '{step_id}' did not succeed. Continuing.")
+            return True
+        self.log(f"   ❌ CRITICAL: step '{step_id}' failed.")
+        if step["action"] != "repeat":
+            self.runtime.dump()
+        return False
+
+    # --- Learned selector order ---
+
+    def profile(self):
+        if self._profile is None:
+            self._profile = device_profile(self.d)
+        return self._profile
+
+    def ordered(self, step, selectors):
+        """Put the selector variants that matched on this kind of device first."""
+        return self.selector_cache.order(self.profile(), step.get("id", step["action"]), selectors)
+
+    def learn(self, step, selector):
+        if selector is not None:
+            self.selector_cache.record(self.profile(), step.get("id", step["action"]), selector)
+
+    # --- Localized texts and screen states ---
+
+    def texts(self):
+        if self._texts is None:
+            self._texts = LocaleTexts.load(device_language(self.d))
+            self.log(f"   🌐 Device language: '{self._texts.language or 'unknown'}'")
+        return self._texts
+
+    def screens(self):
+        if self._screens is None:
+            self._screens = load_screens(texts=self.texts())
+        return self._screens
+
+    def current_state(self):
+        recognizer, _ = self.screens()
+        activity = self.d.app_current().get("activity", "") if recognizer.needs_activity else ""
+        return recognizer.identify(self.runtime.snapshot(), activity)
+
+    def navigate_to(self, target, max_moves=8):
+        """Walk the navigation graph from the current screen to the target state."""
+        _, graph = self.screens()
+        failed_edges = set()
+        for _ in range(max_moves):
+            current = self.current_state()
+            if current == target:
+                self.log(f"   🧭 On '{target}'.")
+                return True
+            path = graph.plan(current, target, exclude=failed_edges)
+            if not path:
+                self.log(f"   🧭 No route from '{current or 'unknown'}' to '{target}'.")
+                return False
+            edge = graph.edges[path[0]]
+            self.log(f"   🧭 {current or 'unknown'} → {edge['to']} (route: {len(path)} move(s))")
+            if not self.run_edge(edge) or not self.wait_for_state(edge["to"], edge.get("timeout", 5)):
+                failed_edges.add(path[0])
+                self.spoil_recording()
+        return self.current_state() == target
+
+    def wait_for_state(self, state, timeout):
+        """Poll until the given state is recognized (e.g. after popups are dismissed)."""
+        deadline = time.time() + timeout
+        while True:
+            if self.current_state() == state:
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(self.runtime.poll_interval)
+
+    def run_edge(self, edge):
+        for step in edge["steps"]:
+            try:
+                ok = self.actions[step["action"]](step)
+            except Exception as e:
+                self.log(f"   ⚠️ Navigation action failed: {e}")
+                ok = False
+            if not ok and not step.get("optional", False):
+                return False
+        return True
+
+    # --- Learned timeouts ---
+
+    def step_timeout(self, step, default):
+        """The step's wait timeout, learned from its durations on this model once known."""
+        timeout = step.get("timeout", default)
+        key = f"{self._flow_name}/{step.get('id', step['action'])}"
+        return self.timings.timeout_for(device_props.for_device(self.d).model, key, timeout,
+                                        factor=2.0, margin=1.0, floor=2.0)
+
+    # --- Cached bounds of stable controls ---
+
+    def bounds_key(self):
+        return bounds_profile(device_props.for_device(self.d).model, *self.runtime.display_size())
+
+    def verify_transition(self, step, before):
+        """Check that a tap led where the step expects (state, element or any change)."""
+        timeout = step.get("expect_timeout", 3)
+        if "expect_state" in step:
+            return self.wait_for_state(step["expect_state"], timeout)
+        if "expect" in step:
+            return self.runtime.wait_for_any(step["expect"], timeout=timeout)[1] is not None
+        return self.runtime.wait_idle(timeout).xml != before.xml
+
+    def tap_cached(self, step):
+        """Tap a cached position for the step; drop the entry if the tap doesn't verify."""
+        profile, target = self.bounds_key(), step["id"]
+        point = self.bounds_cache.get(profile, target)
+        if point is None:
+            return False
+        before = self.runtime.snapshot(max_age=1.0) if not ("expect" in step or "expect_state" in step) else None
+        self.runtime.tap(*point, settle=False)
+        if self.verify_transition(step, before):
+            self.log(f"👍 Tapped cached position {point} for '{target}'.")
+            return True
+        self.log(f"   Cached position {point} for '{target}' did not verify; looking the element up.")
+        self.bounds_cache.invalidate(profile, target)
+        self.spoil_recording()
+        return False
+
+    def remember_bounds(self, step):
+        if step.get("cache_bounds") and self.runtime.last_tap_bounds:
+            self.bounds_cache.put(self.bounds_key(), step["id"], self.runtime.last_tap_bounds)
+
+    # --- Compiled tap scripts ---
+
+    def script_key(self):
+        # Coordinates depend on model and resolution, checkpoint texts on the language.
+        return f"{self.bounds_key()}|{self.texts().language}"
+
+    def run_tap_script(self, flow_name):
+        """Replay the compiled recording of a flow; True if it reached its final checkpoint.
+
+        Recordings are kept per start screen, so a flow recorded from the home
+        screen is only replayed when the device is on the home screen.
+        """
+        key, name = self.script_key(), f"{flow_name}@{self.current_state()}"
+        recording = self.tap_scripts.get(key, name)
+        if recording is None:
+            return False
+        self.log(f"   ⚡ Running compiled tap script ({len(recording['actions'])} actions) in one shell call...")
+        ok, failed = run_script(self.d, compile_script(recording))
+        self.runtime.invalidate()
+        if ok:
+            return True
+        self.log(f"   Tap script stopped at checkpoint {failed}; running the full flow instead.")
+        self.tap_scripts.invalidate(key, name)
+        return False
+
+    def keep_recording(self, flow_name):
+        recorder = self.runtime.recorder
+        if recorder is None:
+            return
+        if not recorder.clean:
+            self.log("   Run needed corrected taps; not compiling a tap script from it.")
+            return
+        self.tap_scripts.put(self.script_key(), f"{flow_name}@{recorder.start_state}",
+                             recorder.finish(self.runtime.wait_idle()))
+        self.log(f"   📼 Recorded {len(recorder.actions)} actions as a tap script for this device model.")
+
+    def spoil_recording(self):
+        if self.runtime.recorder is not None:
+            self.runtime.recorder.spoil()
+
+    # --- Actions ---
+
+    def step_navigate(self, step):
+        if "to" in step:
+            return self.navigate_to(step["to"], max_moves=step.get("max_moves", 8))
+        if "press" in step:
+            self.runtime.press(step["press"])
+            return True
+        if "app" in step:
+            self.runtime.record({"type": "app", "package": step["app"]})
+            self.d.app_start(step["app"], wait=True)
+            self.runtime.invalidate()
+            self.runtime.wait_idle()
+            return True
+        if "intent" in step:
+            self.runtime.record({"type": "intent", "intent": step["intent"]})
+            self.d.shell(["am", "start", "-a", step["intent"]])
+            self.runtime.invalidate()
+            self.runtime.wait_idle()
+            return True
+        raise ValueError("navigate step needs 'to', 'press', 'app' or 'intent'")
+
+    def step_click_any(self, step):
+        description = step.get("description", step.get("id", ""))
+        if step.get("cache_bounds") and self.tap_cached(step):
+            return True
+        matched = self.runtime.click_any(self.ordered(step, step["selectors"]), description,
+                                         timeout=self.step_timeout(step, 5))
+        if matched is not None:
+            self.learn(step, matched)
+            self.remember_bounds(step)
+            return True
+        if "fallback_tap" not in step:
+            return False
+
+        fx, fy = step["fallback_tap"]
+        self.log(f"   Tapping fallback position ({fx:.0%} width, {fy:.0%} height) for '{description}'.")
+        before = self.runtime.snapshot(max_age=1.0)
+        self.runtime.tap_fraction(fx, fy, settle=False)
+        if not self.verify_transition(step, before):
+            self.spoil_recording()
+            return False
+        self.remember_bounds(step)
+        return True
+
+    def step_handle_popups(self, step):
+        # Optional popups the background watcher knows about cost nothing here.
+        packages = self.runtime.snapshot(max_age=1.0).packages()
+        popups = [p for p in step["popups"] if popup_selector(p) is not None
+                  and not (p.get("optional", True) and self.popup_watcher.covers(popup_selector(p), packages))]
+        if not popups:
+            return True
+        selectors = [popup_selector(p) for p in popups]
+        mandatory = [p for p in popups if not p.get("optional", True)]
+        max_actions = step.get("max_attempts", 2)
+        timeout = self.step_timeout(step, max([p.get("click_timeout", 5) for p in mandatory] or [2]))
+
+        actions = 0
+        deadline = time.time() + timeout
+        while actions < max_actions and time.time() < deadline:
+            index, node = self.runtime.click_current(selectors, max_age=0.0)
+            if node is None:
+                time.sleep(self.runtime.poll_interval)
+                continue
+
+            popup = popups[index]
+            self.runtime.wait_idle(timeout=popup.get("wait", 1.0))
+            self.log(f"   ✅ Actioned popup: {selectors[index]} (type: {popup.get('type', 'info')})")
+            actions += 1
+            if popup.get("type", "info").lower() in CRITICAL_TYPES:
+                return True
+            deadline = time.time() + timeout
+
+        if mandatory:
+            self.log("   No mandatory popup from the list was actioned.")
+            return False
+        return True
+
+    def step_scroll_find(self, step):
+        matched = self.runtime.scroll_find(
+            self.ordered(step, target_selectors(step["targets"])),
+            description=step.get("description", step.get("id", "")),
+            max_scrolls=step.get("max_scrolls", 5),
+            directions=step.get("directions", ["forward"]),
+            initial_wait=step.get("timeout", 2),
+        )
+        self.learn(step, matched)
+        return matched is not None
+
+    def step_toggle(self, step):
+        """Scroll to a checkbox or switch preference and tap it only if it isn't in the wanted state."""
+        description = step.get("description", step.get("id", ""))
+        wanted = step.get("checked", True)
+        matched = self.runtime.scroll_find(
+            self.ordered(step, target_selectors(step["targets"])),
+            description=description,
+            max_scrolls=step.get("max_scrolls", 5),
+            directions=step.get("directions", ["forward"]),
+            initial_wait=step.get("timeout", 2),
+            click=False,
+        )
+        if matched is None:
+            return False
+        self.learn(step, matched)
+        # Whether this tap is needed depends on the device, which a replayed tap script can't see
+        self.spoil_recording()
+        toggle = self.find_toggle(matched, max_age=1.0)
+        if toggle is None:
+            self.log(f"   No checkbox or switch found for '{description}'.")
+            return False
+        if (toggle.get("checked") == "true") == wanted:
+            self.log(f"👍 '{description}' already {'on' if wanted else 'off'}.")
+            return True
+        self.runtime.click_node(toggle)
+        toggle = self.find_toggle(matched)
+        ok = toggle is not None and (toggle.get("checked") == "true") == wanted
+        self.log(f"{'👍' if ok else '❌'} Turned '{description}' {'on' if wanted else 'off'}"
+                 f"{'' if ok else ': state did not change'}.")
+        return ok
+
+    def find_toggle(self, selector, max_age=0.0):
+        snap = self.runtime.snapshot(max_age=max_age)
+        node = snap.find(selector)
+        return snap.row_toggle(node) if node is not None else None
+
+    def step_assert(self, step):
+        timeout = self.step_timeout(step, 5)
+        deadline = time.time() + timeout
+        while True:
+            snap = self.runtime.snapshot()
+            ok = True
+            if "package" in step:
+                ok = step["package"] in snap.packages()
+            if ok and "exists" in step:
+                ok = snap.first_match(step["exists"])[1] is not None
+            if ok and "absent" in step:
+                ok = snap.first_match(step["absent"])[1] is None
+            if ok or time.time() >= deadline:
+                return ok
+            time.sleep(self.runtime.poll_interval)
+
+    def step_repeat(self, step):
+        attempts = step.get("attempts", 2)
+        for attempt in range(attempts):
+            self.log(f"   Attempt {attempt + 1}/{attempts} of '{step.get('id', 'repeat')}'")
+            if attempt > 0:
+                journal.event("retry", what=step.get("id", "repeat"), attempt=attempt + 1)
+            if self.run_steps(step["steps"]):
+                return True
+        return False
+
+
+def run_flow(name_or_path, d=None, log=print, facts=()):
+    """Run a flow on the given device or the shared session; return True on success."""
+    if d is None:
+        d = get_device()
+    return FlowEngine(d, log=log, facts=facts).run(load_flow(name_or_path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python flow_engine.py <flow name or path> [...]")
+        sys.exit(2)
+    try:
+        ok = all(run_flow(name) for name in sys.argv[1:])
+    except Exception as e:
+        print(f"❗ AN UNEXPECTED SCRIPT ERROR OCCURRED AT THE HIGHEST LEVEL: {str(e)}")
+        traceback.print_exc()
+        ok = False
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import journal
+from device_shell import AdbDevice, granted_permissions, has_root, su, version_code
+
+# Golden-device app state capture and restore.
+#
+# Capture runs once on a reference device that went through the SuperSU,
+# permission and OpenVPN flows. It pulls each app's data directories as a
+# tarball and records its granted runtime permissions and version in a
+# versioned bundle (golden/bundle_v<N>/manifest.json + <package>.tgz).
+# Restore applies a bundle to a new device as root in a few adb calls and
+# verifies file checksums and permissions, instead of minutes of tapping.
+
+adb_path = "adb"  # Or "C:\\platform-tools\\adb.exe"
+
+BUNDLES_DIR = "golden"
+BUNDLE_FORMAT = 1
+DEVICE_TMP = "/data/local/tmp"
+
+# Apps whose state is captured: data directories (relative to /data/data/<package>)
+# and whether granted runtime permissions are recorded.
+GOLDEN_APPS = [
+    {"package": "eu.chainfire.supersu", "dirs": ["shared_prefs", "files"], "permissions": False},
+    {"package": "net.openvpn.openvpn", "dirs": ["shared_prefs", "files", "databases"], "permissions": True},
+    {"package": "az.osmdroidprop", "dirs": [], "permissions": True},
+]
+
+
+def _log(callback, message):
+    if callback:
+        callback(message)
+
+
+def adb(serial, args, timeout=60):
+    """Run an adb command against one device; return the CompletedProcess."""
+    command = [adb_path] + (["-s", serial] if serial else []) + args
+    return journal.run(command, capture_output=True, text=True, timeout=timeout)
+
+
+def adb_device(serial):
+    """The device as device_shell sees it (its root and dumpsys helpers take one)."""
+    return AdbDevice(serial, adb_path)
+
+
+def root(serial, command, timeout=60):
+    """Output of a root shell command, or None if it failed."""
+    output, code = su(adb_device(serial), command, timeout=timeout)
+    return output if code == 0 else None
+
+
+def dumpsys_package(serial, package):
+    return adb_device(serial).shell(["dumpsys", "package", package]).output
+
+
+def data_checksums(serial, package, dirs):
+    """md5 of every file under the given data directories, keyed by relative path."""
+    if not dirs:
+        return {}
+    output = root(serial, f"cd /data/data/{package} && for d in {' '.join(dirs)}; do "
+                          f"[ -d $d ] && find $d -type f -exec md5sum {{}} +; done") or ""
+    checksums = {}
+    for line in output.splitlines():
+        parts = line.split(None, 1)
+        if len(parts) == 2:
+            checksums[parts[1].strip()] = parts[0]
+    return checksums
+
+
+def bundle_versions(bundles_dir=BUNDLES_DIR):
+    versions = []
+    if os.path.isdir(bundles_dir):
+        for name in os.listdir(bundles_dir):
+            m = re.fullmatch(r"bundle_v(\d+)", name)
+            if m and os.path.isfile(os.path.join(bundles_dir, name, "manifest.json")):
+                versions.append(int(m.group(1)))
+    return sorted(versions)
+
+
+def latest_bundle(bundles_dir=BUNDLES_DIR):
+    versions = bundle_versions(bundles_dir)
+    return os.path.join(bundles_dir, f"bundle_v{versions[-1]}") if versions else None
+
+
+def capture_bundle(serial, bundles_dir=BUNDLES_DIR, apps=None, callback=None):
+    """Capture app state from a correctly set-up reference device into a new bundle.
+
+    Returns the bundle directory, or None on failure.
+    """
+    apps = apps or GOLDEN_APPS
+    if not has_root(adb_device(serial)):
+        _log(callback, "Capture failed: no root shell on the reference device.")
+        return None
+
+    version = (bundle_versions(bundles_dir) or [0])[-1] + 1
+    bundle_dir = os.path.join(bundles_dir, f"bundle_v{version}")
+    os.makedirs(bundle_dir, exist_ok=True)
+    manifest = {"format": BUNDLE_FORMAT, "version": version, "created": int(time.time()),
+                "source": serial, "apps": []}
+
+    for app in apps:
+        package = app["package"]
+        output = dumpsys_package(serial, package)
+        installed = version_code(output)
+        if installed is None:
+            _log(callback, f"Capture failed: {package} is not installed on the reference device.")
+            return None
+        entry = {"package": package, "versionCode": installed, "dirs": app["dirs"],
+                 "permissions": sorted(granted_permissions(output)) if app.get("permissions") else []}
+
+        if app["dirs"]:
+            _log(callback, f"Capturing data of {package}...")
+            remote = f"{DEVICE_TMP}/golden_{package}.tgz"
+            dirs = " ".join(app["dirs"])
+            if root(serial, f"am force-stop {package}; cd /data/data/{package} && "
+                            f"tar -czf {remote} $(for d in {dirs}; do [ -d $d ] && echo $d; done) "
+                            f"&& chmod 644 {remote}", timeout=120) is None:
+                _log(callback, f"Capture failed: could not archive the data of {package}.")
+                return None
+            archive = os.path.join(bundle_dir, f"{package}.tgz")
+            pulled = adb(serial, ["pull", remote, archive], timeout=120)
+            root(serial, f"rm -f {remote}")
+            if pulled.returncode != 0:
+                _log(callback, f"Capture failed: {pulled.stderr.strip()}")
+                return None
+            with open(archive, "rb") as f:
+                entry["archive_sha256"] = hashlib.sha256(f.read()).hexdigest()
+            entry["files"] = data_checksums(serial, package, app["dirs"])
+
+        _log(callback, f"Captured {package} (versionCode {installed}, "
+                       f"{len(entry.get('files', {}))} files, {len(entry['permissions'])} permissions)")
+        manifest["apps"].append(entry)
+
+    with open(os.path.join(bundle_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    _log(callback, f"Golden bundle v{version} written to {bundle_dir}")
+    return bundle_dir
+
+
+def load_manifest(bundle_dir):
+    with open(os.path.join(bundle_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format {manifest.get('format')} in {bundle_dir}")
+    return manifest
+
+
+def verify_app(serial, entry, callback=None):
+    """Check restored files and permissions of one app against the manifest."""
+    package = entry["package"]
+    if entry.get("files"):
+        actual = data_checksums(serial, package, entry["dirs"])
+        mismatched = [path for path, md5 in entry["files"].items() if actual.get(path) != md5]
+        if mismatched:
+            _log(callback, f"Verify failed for {package}: {len(mismatched)} file(s) differ "
+                           f"(e.g. {mismatched[0]})")
+            return False
+    missing = set(entry.get("permissions", [])) - granted_permissions(dumpsys_package(serial, package))
+    if missing:
+        _log(callback, f"Verify failed for {package}: permissions not granted: {', '.join(sorted(missing))}")
+        return False
+    return True
+
+
+def restore_app(serial, bundle_dir, entry, callback=None):
+    package = entry["package"]
+    installed = version_code(dumpsys_package(serial, package))
+    if installed is None:
+        _log(callback, f"Restore failed: {package} is not installed.")
+        return False
+    if installed != entry["versionCode"]:
+        # App data formats are only guaranteed to match for the same build.
+        _log(callback, f"Restore skipped for {package}: installed versionCode {installed}, "
+                       f"bundle has {entry['versionCode']}.")
+        return False
+
+    if entry.get("dirs"):
+        archive = os.path.join(bundle_dir, f"{package}.tgz")
+        with open(archive, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != entry["archive_sha256"]:
+                _log(callback, f"Restore failed: {archive} does not match the manifest.")
+                return False
+        remote = f"{DEVICE_TMP}/golden_{package}.tgz"
+        pushed = adb(serial, ["push", archive, remote], timeout=120)
+        if pushed.returncode != 0:
+            _log(callback, f"Restore failed: {pushed.stderr.strip()}")
+            return False
+        data_dir = f"/data/data/{package}"
+        dirs = " ".join(entry["dirs"])
+        restored = root(serial, f"am force-stop {package}; cd {data_dir} && rm -rf {dirs} && "
+                                f"tar -xzf {remote} && owner=$(stat -c %u:%g {data_dir}) && "
+                                f"for d in {dirs}; do [ -d $d ] && chown -R $owner $d; done; "
+                                f"restorecon -R {data_dir}; rm -f {remote}; echo restored", timeout=120)
+        if restored is None or "restored" not in restored:
+            _log(callback, f"Restore failed: could not unpack the data of {package}.")
+            return False
+
+    for permission in entry.get("permissions", []):
+        adb(serial, ["shell", "pm", "grant", package, permission])
+
+    return verify_app(serial, entry, callback)
+
+
+def restore_packages(serial, bundle_dir=None, packages=None, callback=None):
+    """Apply a golden bundle (the latest by default) to a device as root and verify it.
+
+    packages restricts the restore to some apps. Returns the packages that
+    were restored and verified.
+    """
+    bundle_dir = bundle_dir or latest_bundle()
+    if bundle_dir is None:
+        _log(callback, "No golden bundle found.")
+        return []
+    manifest = load_manifest(bundle_dir)
+    if not has_root(adb_device(serial)):
+        _log(callback, "Restore failed: no root shell on the device.")
+        return []
+
+    _log(callback, f"Restoring golden bundle v{manifest['version']} from {bundle_dir}...")
+    start = time.time()
+    restored, failed = [], []
+    for entry in manifest["apps"]:
+        if packages and entry["package"] not in packages:
+            continue
+        if restore_app(serial, bundle_dir, entry, callback):
+            _log(callback, f"Restored and verified {entry['package']}")
+            restored.append(entry["package"])
+        else:
+            failed.append(entry["package"])
+    _log(callback, f"Golden restore {'FAILED for ' + ', '.join(failed) if failed else 'finished'} "
+                   f"in {time.time() - start:.1f}s")
+    return restored
+
+
+def restore_bundle(serial, bundle_dir=None, packages=None, callback=None):
+    """Like restore_packages; True only if every selected app was restored and verified."""
+    bundle_dir = bundle_dir or latest_bundle()
+    if bundle_dir is None:
+        _log(callback, "No golden bundle found.")
+        return False
+    selected = [e["package"] for e in load_manifest(bundle_dir)["apps"] if not packages or e["package"] in packages]
+    return len(restore_packages(serial, bundle_dir, packages, callback)) == len(selected)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("capture", "restore", "verify"):
+        print("Usage: python golden_state.py capture [serial]\n"
+              "       python golden_state.py restore [serial] [bundle dir]\n"
+              "       python golden_state.py verify [serial] [bundle dir]")
+        sys.exit(2)
+    mode = sys.argv[1]
+    device = sys.argv[2] if len(sys.argv) > 2 else None
+    bundle = sys.argv[3] if len(sys.argv) > 3 else None
+    if mode == "capture":
+        ok = capture_bundle(device, callback=print) is not None
+    elif mode == "restore":
+        ok = restore_bundle(device, bundle, callback=print)
+    else:
+        bundle = bundle or latest_bundle()
+        ok = bundle is not None and all(verify_app(device, entry, print)
+                                        for entry in load_manifest(bundle)["apps"])
+        print("Verified." if ok else "Verification failed.")
+    sys.exit(0 if ok else 1)
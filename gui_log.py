@@ -0,0 +1,92 @@
+import os
+import queue
+import time
+import tkinter as tk
+
+# Log pipeline for the Tk GUI.
+#
+# Worker threads only put messages on a queue. A Tk timer drains it in
+# batches: one write of the whole batch to the log file on disk and one insert
+# into the text widget, which keeps at most max_lines visible lines (the
+# oldest are dropped). Large outputs such as a whole Kandel script run cost a
+# single insert, and the GUI never waits on a worker.
+
+LOG_DIR = "logs"
+
+
+class TkLogPipeline:
+    """Thread-safe, batched, bounded logging into a Tk text widget plus a full log file."""
+
+    def __init__(self, root, widget, max_lines=2000, interval_ms=100, max_batch=5000, log_dir=LOG_DIR):
+        self.root = root
+        self.widget = widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._visible_lines = 0
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, time.strftime("pico_setup_%Y%m%d_%H%M%S.log"))
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._closed = False
+        self.root.after(self.interval_ms, self._drain)
+
+    def put(self, message):
+        """Queue a message; safe to call from any thread."""
+        self._queue.put(message)
+
+    def _take_batch(self):
+        messages = []
+        try:
+            while len(messages) < self.max_batch:
+                messages.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def _drain(self):
+        if self._closed:
+            return
+        messages = self._take_batch()
+        if messages:
+            text = "\n".join(messages) + "\n"
+            self._file.write(text)
+            self._file.flush()
+            self._show(text.splitlines())
+        # Drain again right away while there is a backlog, otherwise on the timer.
+        self.root.after(1 if len(messages) == self.max_batch else self.interval_ms, self._drain)
+
+    def _show(self, lines):
+        widget = self.widget
+        at_bottom = widget.yview()[1] >= 0.999
+        widget.configure(state="normal")
+        if len(lines) >= self.max_lines:
+            # The batch alone fills the view: replace everything with its tail.
+            skipped = len(lines) - self.max_lines + 1
+            lines = [f"… {skipped} earlier lines in {self.path}"] + lines[-(self.max_lines - 1):]
+            widget.delete("1.0", tk.END)
+            self._visible_lines = 0
+        widget.insert(tk.END, "\n".join(lines) + "\n")
+        self._visible_lines += len(lines)
+        excess = self._visible_lines - self.max_lines
+        if excess > 0:
+            widget.delete("1.0", f"{excess + 1}.0")
+            self._visible_lines -= excess
+        widget.configure(state="disabled")
+        if at_bottom:
+            widget.see(tk.END)
+
+    def close(self):
+        """Write out what is still queued and close the log file."""
+        if self._closed:
+            return
+        self._closed = True
+        messages = []
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                break
+            messages += batch
+        if messages:
+            self._file.write("\n".join(messages) + "\n")
+        self._file.close()
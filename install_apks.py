@@ -1,17 +1,29 @@
-import subprocess
 import os
 
+import journal
+
 # Define the path to adb (adjust as needed)
 adb_path = "adb"  # Or "C:\\platform-tools\\adb.exe"
 
-def uninstall_apk(package_name, callback=None):
+# APKs installed on every device
+DEFAULT_APKS = [
+    {"package": "az.osmdroidprop", "file": "apk/tukpy_rev_27004.apk"},
+    {"package": "net.openvpn.openvpn", "file": "apk/OpenVPN.apk"},
+    # Add more APKs as needed
+]
+
+def adb_command(args, serial=None):
+    """adb command line, targeting one device if a serial is given."""
+    return [adb_path] + (["-s", serial] if serial else []) + args
+
+def uninstall_apk(package_name, callback=None, serial=None):
     """Uninstall an APK by package name with optional GUI callback."""
     message = f"Uninstalling {package_name}..."
     if callback:
         callback(message)
     
-    result = subprocess.run(
-        [adb_path, "uninstall", package_name],
+    result = journal.run(
+        adb_command(["uninstall", package_name], serial),
         capture_output=True,
         text=True
     )
@@ -28,14 +40,14 @@ def uninstall_apk(package_name, callback=None):
         callback(message)
     return message
 
-def install_apk(apk_file, callback=None):
+def install_apk(apk_file, callback=None, serial=None):
     """Install an APK with optional GUI callback."""
     message = f"Installing {apk_file}..."
     if callback:
         callback(message)
     
-    result = subprocess.run(
-        [adb_path, "install", "-r", "-t", apk_file],
+    result = journal.run(
+        adb_command(["install", "-r", "-t", apk_file], serial),
         capture_output=True,
         text=True
     )
@@ -49,30 +61,34 @@ def install_apk(apk_file, callback=None):
         callback(message)
     return message
 
-def process_apks(apk_list, callback=None):
-    """Process a list of APKs (uninstall then install each)."""
+def process_apks(apk_list, callback=None, serial=None):
+    """Process a list of APKs (uninstall then install each).
+
+    Returns the packages that installed successfully.
+    """
+    installed = []
     for apk_info in apk_list:
         # Uninstall first
-        uninstall_result = uninstall_apk(apk_info["package"], callback)
+        uninstall_result = uninstall_apk(apk_info["package"], callback, serial)
         
         # Then install
-        install_result = install_apk(apk_info["file"], callback)
+        install_result = install_apk(apk_info["file"], callback, serial)
+        if install_result.startswith("Success"):
+            installed.append(apk_info["package"])
     
-    return "APK processing complete"
+    return installed
 
 # ✅ Add this missing function to be used by pico_setup.py
-def run_install_process(callback=None):
-    """Main function that runs installation process for default APKs."""
-    apk_list = [
-        {"package": "az.osmdroidprop", "file": "apk/tukpy_rev_27004.apk"},
-        {"package": "net.openvpn.openvpn", "file": "apk/OpenVPN.apk"},
-        # Add more APKs as needed
-    ]
+def run_install_process(callback=None, serial=None):
+    """Main function that runs installation process for default APKs.
 
+    Returns the packages that installed successfully.
+    """
     if callback:
         callback("Starting APK installation process...")
 
-    process_apks(apk_list, callback)
+    installed = process_apks(DEFAULT_APKS, callback, serial)
 
     if callback:
         callback("Installation process finished.")
+    return installed
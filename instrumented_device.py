@@ -0,0 +1,107 @@
+import inspect
+import time
+
+import cancellation
+import journal
+
+# Timing proxy around a uiautomator2 device.
+#
+# Every method call on the device (click, swipe, dump_hierarchy, shell, ...),
+# every selector object method (d(text=...).click(), .wait(), ...), reads of
+# the `info` properties and each evaluation of d(...).exists is journaled as
+# one "u2" event with its duration, so the trace export and the RPC accounting
+# see each agent round trip. Each call first checks the thread's cancellation
+# token (cancellation.py). The sessions of device_session.py hand out
+# wrapped devices; everything else passes through unchanged.
+
+# Properties that are a device round trip when read
+RPC_PROPERTIES = ("info",)
+OBJECT_RPC_PROPERTIES = ("info", "count")
+
+
+def _timed(call, name, serial, target=None):
+    def wrapper(*args, **kwargs):
+        cancellation.check()
+        start = time.time()
+        error = None
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            journal.event("u2", call=name, target=target, serial=serial,
+                          duration=round(time.time() - start, 4), error=error)
+    return wrapper
+
+
+def _timed_read(read, name, serial, target=None):
+    cancellation.check()
+    start = time.time()
+    try:
+        return read()
+    finally:
+        journal.event("u2", call=name, target=target, serial=serial, duration=round(time.time() - start, 4))
+
+
+class _Exists:
+    """d(...).exists: the round trip happens on bool() or call, not on attribute access."""
+
+    def __init__(self, exists, serial, target):
+        self._exists = exists
+        self._serial = serial
+        self._target = target
+
+    def __bool__(self):
+        return _timed_read(lambda: bool(self._exists), "exists", self._serial, self._target)
+
+    def __call__(self, *args, **kwargs):
+        return _timed(self._exists, "exists", self._serial, self._target)(*args, **kwargs)
+
+
+class InstrumentedObject:
+    """A selector object (d(...)) whose method calls are journaled."""
+
+    def __init__(self, obj, serial, target):
+        self._obj = obj
+        self._serial = serial
+        self._target = target
+
+    def __getattr__(self, name):
+        if name in OBJECT_RPC_PROPERTIES:
+            return _timed_read(lambda: getattr(self._obj, name), name, self._serial, self._target)
+        value = getattr(self._obj, name)
+        if name == "exists" and not inspect.ismethod(value):
+            return _Exists(value, self._serial, self._target)
+        if inspect.ismethod(value) and not name.startswith("_"):
+            return _timed(value, name, self._serial, self._target)
+        return value
+
+    def __getitem__(self, index):
+        return InstrumentedObject(self._obj[index], self._serial, f"{self._target}[{index}]")
+
+    def __len__(self):
+        return len(self._obj)
+
+
+class InstrumentedDevice:
+    """A uiautomator2 device whose calls are journaled as "u2" events."""
+
+    def __init__(self, device, serial=None):
+        self.__dict__["_device"] = device
+        self.__dict__["_serial"] = serial
+
+    def __getattr__(self, name):
+        if name in RPC_PROPERTIES:
+            return _timed_read(lambda: getattr(self._device, name), name, self._serial)
+        value = getattr(self._device, name)
+        if inspect.ismethod(value) and not name.startswith("_"):
+            return _timed(value, name, self._serial)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._device, name, value)
+
+    def __call__(self, **kwargs):
+        target = ",".join(f"{k}={v}" for k, v in kwargs.items())
+        return InstrumentedObject(self._device(**kwargs), self._serial, target)
@@ -0,0 +1,193 @@
+import atexit
+import contextlib
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import cancellation
+
+# Structured run journal.
+#
+# Every adb command, UI input action and stage/flow/step transition is written
+# as one JSON line to logs/journal.jsonl: time, kind, thread, serial, step, and for
+# commands the command line, duration, exit code and output bytes. Callers only
+# put the event on a queue; a background thread does the writing, rotates the
+# file once it passes MAX_BYTES and gzips the rotated part, keeping the last
+# BACKUPS of them. The serial and step of an event come from the calling
+# thread's context() unless given explicitly. Listeners (the trace exporter,
+# the RPC accounting) see each event synchronously, on the thread that
+# produced it.
+
+JOURNAL_DIR = "logs"
+JOURNAL_FILE = "journal.jsonl"
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 20
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Attach fields (serial, step, flow, ...) to the events of this thread inside the block."""
+    previous = getattr(_local, "fields", {})
+    _local.fields = {**previous, **{k: v for k, v in fields.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _local.fields = previous
+
+
+def current_context():
+    return dict(getattr(_local, "fields", {}))
+
+
+class Journal:
+    """Append-only JSONL event log written by a background thread."""
+
+    def __init__(self, path=None, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = path or os.path.join(JOURNAL_DIR, JOURNAL_FILE)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.listeners = []
+
+    def event(self, kind, **fields):
+        """Queue one event; never blocks on disk."""
+        record = {"ts": round(time.time(), 4), "kind": kind, "thread": threading.current_thread().name,
+                  **current_context()}
+        record.update({k: v for k, v in fields.items() if v is not None})
+        self._ensure_writer()
+        self._queue.put(record)
+        for listener in tuple(self.listeners):
+            try:
+                listener(record)
+            except Exception:
+                pass
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+                    self._thread.start()
+
+    def _writer(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a", encoding="utf-8")
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                f.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch))
+                f.flush()
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+            except OSError:
+                pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _rotate(self):
+        base, _ = os.path.splitext(self.path)
+        now = time.time()
+        rotated = f"{base}.{time.strftime('%Y%m%d_%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}.jsonl"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        for old in sorted(glob.glob(f"{glob.escape(base)}.*.jsonl.gz"))[:-self.backups or None]:
+            os.remove(old)
+
+    def flush(self):
+        """Wait until every queued event is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal()
+            # The writer is a daemon thread; don't lose the tail of the run at exit.
+            atexit.register(_journal.flush)
+        return _journal
+
+
+def event(kind, **fields):
+    get_journal().event(kind, **fields)
+
+
+def add_listener(listener):
+    """Call listener(record) for every event from now on."""
+    get_journal().listeners.append(listener)
+
+
+def remove_listener(listener):
+    listeners = get_journal().listeners
+    if listener in listeners:
+        listeners.remove(listener)
+
+
+def flush():
+    if _journal is not None:
+        _journal.flush()
+
+
+def _serial_of(command):
+    if "-s" in command[:-1]:
+        return command[command.index("-s") + 1]
+    return None
+
+
+def _size(output):
+    if output is None:
+        return 0
+    return len(output.encode("utf-8", "replace")) if isinstance(output, str) else len(output)
+
+
+def run(command, **kwargs):
+    """subprocess.run() an adb command line and journal it; same return value and exceptions.
+
+    The command is killed if the calling thread's cancellation token is cancelled.
+    """
+    fields = {"command": " ".join(str(part) for part in command), "serial": _serial_of(command)}
+    start = time.time()
+    try:
+        result = cancellation.run(command, **kwargs)
+    except cancellation.Cancelled:
+        event("adb", **fields, duration=round(time.time() - start, 3), exit_code=None, cancelled=True)
+        raise
+    except subprocess.TimeoutExpired as e:
+        event("adb", **fields, duration=round(time.time() - start, 3), exit_code=None, timed_out=True,
+              bytes=_size(e.stdout) + _size(e.stderr))
+        raise
+    except subprocess.CalledProcessError as e:
+        event("adb", **fields, duration=round(time.time() - start, 3), exit_code=e.returncode,
+              bytes=_size(e.stdout) + _size(e.stderr))
+        raise
+    except OSError as e:
+        event("adb", **fields, duration=round(time.time() - start, 3), exit_code=None, error=str(e))
+        raise
+    event("adb", **fields, duration=round(time.time() - start, 3), exit_code=result.returncode,
+          bytes=_size(result.stdout) + _size(result.stderr))
+    return result
@@ -0,0 +1,40 @@
+import json
+import os
+import threading
+
+# Base of the small persistent JSON stores under pico_state/ (learned selector
+# order, cached bounds, tap scripts, checkpoints, timings, ...).
+#
+# The data is one JSON object, loaded when the store is created (a missing or
+# unreadable file starts empty) and written back by save() only if something
+# changed, through a temporary file so a crash never leaves half a file.
+# Subclasses change self._data under self._lock and set self._dirty.
+
+
+class JsonStore:
+    """A JSON object persisted at path."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -0,0 +1,187 @@
+import bisect
+import http.server
+import threading
+
+import journal
+
+# Local Prometheus metrics endpoint.
+#
+# A journal listener turns run events into counters and histograms (labeled
+# by step and result): connect attempts, adb commands, stage durations
+# (install_apks, the Kandel scripts, reboot turnaround, ...), UI flow and
+# step durations, retries, expired UI timeouts and finished bring-ups.
+# serve() exposes them in the Prometheus text format on
+# http://127.0.0.1:<port>/metrics from a daemon thread; pico_setup.py and
+# bringup.py start it with --metrics-port=<port>. Devices per hour is
+# rate(pico_bringups_total{result="ok"}[1h]) * 3600.
+
+DEFAULT_PORT = 9108
+
+# Seconds; covers single adb calls up to the 10 minute Kandel script
+BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Registry:
+    """Counters and histograms keyed by metric name and label set."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, help_text, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.help.setdefault(name, ("counter", help_text))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, help_text, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.help.setdefault(name, ("histogram", help_text))
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                hist["buckets"][index] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self.help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self.counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                for (metric, labels), hist in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                    lines.append(f"{name}_sum{_labels(labels)} {hist['sum']:.3f}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _result(ok):
+    return "ok" if ok else "failed"
+
+
+class RunMetrics:
+    """Journal listener feeding a Registry."""
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else Registry()
+
+    def __call__(self, record):
+        r = self.registry
+        kind = record["kind"]
+        if kind == "adb":
+            words = record.get("command", "").split()
+            # "adb -s <serial> shell ..." -> "shell"
+            args = words[3:] if words[1:2] == ["-s"] else words[1:]
+            command = args[0] if args else "adb"
+            result = "timeout" if record.get("timed_out") else _result(record.get("exit_code") == 0)
+            r.inc("pico_adb_commands_total", "adb commands run.", command=command, result=result)
+            r.observe("pico_adb_command_duration_seconds", "adb command duration.", record.get("duration", 0),
+                      command=command)
+            if command == "connect":
+                r.inc("pico_connect_attempts_total", "adb connect attempts.", result=result)
+        elif kind == "stage_end":
+            result = _result(record.get("ok"))
+            r.inc("pico_stage_runs_total", "Bring-up stages run.", step=record.get("step"), result=result)
+            r.observe("pico_stage_duration_seconds", "Bring-up stage duration (install_apks, scripts, reboot, ...).",
+                      record.get("duration", 0), step=record.get("step"), result=result)
+        elif kind == "bringup_end":
+            result = _result(record.get("ok"))
+            r.inc("pico_bringups_total", "Device bring-ups finished.", result=result)
+            r.observe("pico_bringup_duration_seconds", "Whole device bring-up duration.",
+                      record.get("duration", 0), result=result)
+        elif kind == "flow_end":
+            result = _result(record.get("ok"))
+            r.inc("pico_flow_runs_total", "UI flows run.", flow=record.get("flow"), result=result)
+            r.observe("pico_flow_duration_seconds", "UI flow duration.", record.get("duration", 0),
+                      flow=record.get("flow"), result=result)
+        elif kind == "step_end":
+            result = _result(record.get("ok"))
+            r.observe("pico_flow_step_duration_seconds", "UI flow step duration.", record.get("duration", 0),
+                      flow=record.get("flow"), step=record.get("step"), result=result)
+        elif kind == "retry":
+            r.inc("pico_retries_total", "Retried scripts and flow steps.", step=record.get("step"),
+                  what=record.get("what"))
+        elif kind == "timeout":
+            r.inc("pico_ui_timeouts_total", "UI waits that gave up.", step=record.get("step", "(no step)"))
+
+
+_metrics = None
+_lock = threading.Lock()
+
+
+def get_metrics():
+    """The process-wide RunMetrics, listening to the journal from the first call."""
+    global _metrics
+    with _lock:
+        if _metrics is None:
+            _metrics = RunMetrics()
+            journal.add_listener(_metrics)
+        return _metrics
+
+
+def serve(port=DEFAULT_PORT, host="127.0.0.1"):
+    """Serve /metrics in a daemon thread; return the server."""
+    registry = get_metrics().registry
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def port_from_args(argv):
+    """The port of a --metrics-port[=N] flag, or None."""
+    for arg in argv:
+        if arg == "--metrics-port":
+            return DEFAULT_PORT
+        if arg.startswith("--metrics-port="):
+            return int(arg.split("=", 1)[1])
+    return None
@@ -0,0 +1,152 @@
+import os
+import re
+import shlex
+
+import root_prefs
+from device_shell import has_root, su, version_code
+from flow_engine import FlowEngine, load_flow
+from json_store import JsonStore
+
+# Fast-path OpenVPN configuration.
+#
+# Instead of importing dev900.ovpn through the file picker (Internal storage →
+# Download → file) and reaching CONTINUOUSLY RETRY through the side menu, the
+# profile is pushed and handed to OpenVPN with a VIEW intent, leaving only the
+# import confirmation and connect taps (flows/openvpn_import.json). The
+# import is verified by finding the profile's remote host in the app data.
+#
+# Which preference "Continuously retry" sets isn't documented, so it is
+# learned: the first time, the option is set through OpenVPN's settings
+# (flows/openvpn_reconnect.json) and the preference values the app changed
+# are stored per OpenVPN version in pico_state/openvpn_prefs.json. From then
+# on those confirmed values are written as root instead, and the bring-up
+# skips OpenVPN on devices that already have them. openvpn.py falls back to
+# the full UI flow if any of this fails.
+
+OPENVPN_PACKAGE = "net.openvpn.openvpn"
+PROFILE_NAME = "dev900.ovpn"
+LOCAL_PROFILE = PROFILE_NAME
+DEVICE_PROFILE = f"/sdcard/Download/{PROFILE_NAME}"
+PROFILE_MIME = "application/x-openvpn-profile"
+
+PREFS_NAME = f"{OPENVPN_PACKAGE}_preferences"
+LEARNED_PREFS_FILE = os.path.join("pico_state", "openvpn_prefs.json")
+
+_REMOTE_RE = re.compile(r"^\s*remote\s+(\S+)", re.MULTILINE)
+
+# More changed values than this and the change isn't attributable to the option
+MAX_LEARNED_KEYS = 3
+
+
+class ReconnectPrefsStore(JsonStore):
+    """Preference values "Continuously retry" set, as observed per OpenVPN versionCode."""
+
+    def __init__(self, path=LEARNED_PREFS_FILE):
+        super().__init__(path)
+
+    def get(self, version):
+        """{key: value} learned for this version, or None."""
+        return self._data.get(str(version)) or None
+
+    def put(self, version, values):
+        with self._lock:
+            self._data[str(version)] = values
+            self._dirty = True
+
+
+def app_version(d):
+    """OpenVPN's installed versionCode, or None."""
+    return version_code(d.shell(["dumpsys", "package", OPENVPN_PACKAGE]).output)
+
+
+def changed_prefs(before, after):
+    """The scalar preference values that differ between two reads."""
+    return {key: value for key, value in after.items()
+            if before.get(key) != value and isinstance(value, (str, bool, int, float))}
+
+
+def profile_remote(d, device_path=DEVICE_PROFILE):
+    """The first `remote` host of the profile on the device (None if unreadable)."""
+    output = d.shell(["cat", device_path]).output
+    m = _REMOTE_RE.search(output)
+    return m.group(1) if m else None
+
+
+def profile_imported(d, remote):
+    """True if OpenVPN's data directory holds a profile with this remote host."""
+    output, _ = su(d, f"grep -rlF {shlex.quote(remote)} /data/data/{OPENVPN_PACKAGE} 2>/dev/null")
+    return bool(output.strip())
+
+
+def push_profile(d, local_path=LOCAL_PROFILE, device_path=DEVICE_PROFILE, log=print):
+    """Push the profile if a local copy exists; otherwise expect it on the device already."""
+    if os.path.isfile(local_path):
+        d.push(local_path, device_path)
+        log(f"   Pushed {local_path} to {device_path}")
+    return d.shell(["ls", device_path]).exit_code == 0
+
+
+def import_profile(d, device_path=DEVICE_PROFILE, log=print):
+    """Open the profile in OpenVPN with a VIEW intent and confirm the import."""
+    d.shell(["am", "start", "-a", "android.intent.action.VIEW", "-d", f"file://{device_path}",
+             "-t", PROFILE_MIME, "-p", OPENVPN_PACKAGE])
+    return FlowEngine(d, log=log).run(load_flow("openvpn_import"))
+
+
+def set_reconnect_by_ui(d, store, version, log=print):
+    """Enable continuous retry through the settings screen and learn the preferences it changed."""
+    before = root_prefs.read_prefs(d, OPENVPN_PACKAGE, PREFS_NAME)
+    if not FlowEngine(d, log=log).run(load_flow("openvpn_reconnect")):
+        return False
+    learned = changed_prefs(before, root_prefs.read_prefs(d, OPENVPN_PACKAGE, PREFS_NAME))
+    if version is not None and 0 < len(learned) <= MAX_LEARNED_KEYS:
+        store.put(version, learned)
+        store.save()
+        log(f"   Learned the continuous retry preference of OpenVPN {version}: {learned}")
+    return True
+
+
+def configure_openvpn(d, log=print, store=None):
+    """Import dev900.ovpn and set continuous retry with as little UI as possible; True if verified."""
+    if not has_root(d):
+        log("   OpenVPN fast path needs root; using the UI flow.")
+        return False
+    if not push_profile(d, log=log):
+        log(f"   {DEVICE_PROFILE} not found on the device; using the UI flow.")
+        return False
+    remote = profile_remote(d)
+    if remote is None:
+        log(f"   No 'remote' line in {DEVICE_PROFILE}; using the UI flow.")
+        return False
+
+    store = store if store is not None else ReconnectPrefsStore()
+    version = app_version(d)
+    reconnect = store.get(version)
+    # Preferences first: writing them force-stops OpenVPN, which would drop the connection.
+    if reconnect and not root_prefs.write_prefs(d, OPENVPN_PACKAGE, PREFS_NAME, reconnect):
+        log("   Could not write the reconnect preference; using the UI flow.")
+        return False
+
+    if profile_imported(d, remote):
+        log(f"   Profile for {remote} is already imported.")
+    elif not import_profile(d, log=log) or not profile_imported(d, remote):
+        log("   Intent import did not produce the profile; using the UI flow.")
+        return False
+    if not reconnect:
+        log(f"   Continuous retry not learned yet for OpenVPN {version}; setting it in the app's settings.")
+        if not set_reconnect_by_ui(d, store, version, log=log):
+            log("   Could not set continuous retry; using the UI flow.")
+            return False
+    log(f"✅ OpenVPN configured: profile for {remote} imported, continuous retry set.")
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    from device_session import get_device
+    device = get_device()
+    if "--show-prefs" in sys.argv:
+        for key, value in sorted(root_prefs.read_prefs(device, OPENVPN_PACKAGE, PREFS_NAME).items()):
+            print(f"{key} = {value!r}")
+        sys.exit(0)
+    sys.exit(0 if configure_openvpn(device) else 1)
@@ -5,7 +5,7 @@ a = Analysis(
     ['pico_setup.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('flows', 'flows')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
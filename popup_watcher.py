@@ -0,0 +1,109 @@
+import contextlib
+import json
+import os
+import threading
+
+from ui_runtime import describe_node, selector_key
+
+# Background dismissal of known popups.
+#
+# Instead of every flow step probing for optional popups with a blocking
+# timeout, one watcher thread per device session checks the shared hierarchy
+# snapshot against a registry of dismissible popups (flows/popups.json) and
+# taps them as soon as they appear. When no popup is shown, which is the usual
+# case, the main flow pays nothing. While a flow step runs (busy()), the
+# watcher checks less often and mostly reuses the step's own dumps.
+
+POPUPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows", "popups.json")
+
+
+def load_popup_registry(path=POPUPS_FILE):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["popups"]
+
+
+class PopupWatcher:
+    """Daemon thread that dismisses registered popups on a shared UiRuntime."""
+
+    def __init__(self, runtime, registry=None, interval=0.5, busy_interval=2.0, log=print):
+        self.runtime = runtime
+        self.registry = registry if registry is not None else load_popup_registry()
+        self.interval = interval
+        self.busy_interval = busy_interval
+        self.log = log
+        self.dismissed = 0
+        # Nesting depth of busy() (repeat steps run steps within a step)
+        self._busy = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def covers(self, selector, packages=()):
+        """True if the watcher already handles this popup selector for the given apps."""
+        key = selector_key(selector)
+        return any(selector_key(entry["selector"]) == key
+                   and ("package" not in entry or entry["package"] in packages)
+                   for entry in self.registry)
+
+    def match(self, snapshot):
+        """Return (entry, node) for the first registered popup visible in the snapshot."""
+        packages = snapshot.packages()
+        for entry in self.registry:
+            if "package" in entry and entry["package"] not in packages:
+                continue
+            node = snapshot.find(entry["selector"])
+            if node is None:
+                continue
+            if any(snapshot.find(selector) is not None for selector in entry.get("absent", [])):
+                continue
+            return entry, node
+        return None, None
+
+    @contextlib.contextmanager
+    def busy(self):
+        """Check every busy_interval instead of every interval while the block runs."""
+        self._busy += 1
+        try:
+            yield self
+        finally:
+            self._busy -= 1
+
+    def current_interval(self):
+        return self.busy_interval if self._busy else self.interval
+
+    def check_once(self):
+        """Check the current (shared) snapshot and dismiss one popup if present."""
+        with self.runtime.lock:
+            entry, node = self.match(self.runtime.snapshot(max_age=self.current_interval()))
+            if entry is None:
+                return False
+            self.runtime.click_node(node, settle=False)
+        self.dismissed += 1
+        self.log(f"   🧹 Dismissed popup '{entry['id']}' ({describe_node(node)})")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check_once()
+            except Exception as e:
+                self.log(f"   ⚠️ Popup watcher check failed: {e}")
+            self._stop.wait(self.current_interval())
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="popup-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 4)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
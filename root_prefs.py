@@ -0,0 +1,97 @@
+import os
+import shlex
+import tempfile
+import xml.etree.ElementTree as ET
+
+from device_shell import su
+
+# Root access to app SharedPreferences files.
+#
+# The fast-path configurators (openvpn_config.py, supersu_config.py) set app
+# settings by editing /data/data/<package>/shared_prefs/<name>.xml over an
+# `su` shell instead of tapping through settings screens, then read the file
+# back to verify. The app is force-stopped first so it can't overwrite the
+# file with its in-memory copy.
+
+DEVICE_TMP = "/data/local/tmp"
+
+EMPTY_PREFS = "<?xml version='1.0' encoding='utf-8' standalone='yes' ?>\n<map />\n"
+
+
+def prefs_path(package, name):
+    return f"/data/data/{package}/shared_prefs/{name}.xml"
+
+
+def read_prefs(d, package, name):
+    """Return the preferences of an app as {key: value}; {} if the file doesn't exist."""
+    output, code = su(d, f"cat {shlex.quote(prefs_path(package, name))}")
+    if code != 0 or "<map" not in output:
+        return {}
+    return parse_prefs(output)
+
+
+def parse_prefs(xml_text):
+    values = {}
+    for element in ET.fromstring(xml_text[xml_text.index("<map"):]):
+        key = element.get("name")
+        if element.tag == "string":
+            values[key] = element.text or ""
+        elif element.tag == "boolean":
+            values[key] = element.get("value") == "true"
+        elif element.tag in ("int", "long"):
+            values[key] = int(element.get("value"))
+        elif element.tag == "float":
+            values[key] = float(element.get("value"))
+        elif element.tag == "set":
+            values[key] = {child.text or "" for child in element}
+    return values
+
+
+def update_prefs_xml(xml_text, updates):
+    """Apply {key: value} to a SharedPreferences XML document; return the new document."""
+    root = ET.fromstring(xml_text[xml_text.index("<map"):] if "<map" in xml_text else "<map />")
+    for key, value in updates.items():
+        for element in [e for e in root if e.get("name") == key]:
+            root.remove(element)
+        if isinstance(value, bool):
+            ET.SubElement(root, "boolean", name=key, value="true" if value else "false")
+        elif isinstance(value, int):
+            ET.SubElement(root, "int", name=key, value=str(value))
+        elif isinstance(value, float):
+            ET.SubElement(root, "float", name=key, value=repr(value))
+        elif isinstance(value, (set, frozenset, list)):
+            element = ET.SubElement(root, "set", name=key)
+            for item in sorted(value):
+                ET.SubElement(element, "string").text = item
+        else:
+            ET.SubElement(root, "string", name=key).text = str(value)
+    ET.indent(root, space="    ")
+    return "<?xml version='1.0' encoding='utf-8' standalone='yes' ?>\n" + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def write_prefs(d, package, name, updates):
+    """Set preference values of an app as root; return True if they read back as written."""
+    path = prefs_path(package, name)
+    current, code = su(d, f"cat {shlex.quote(path)} 2>/dev/null")
+    document = update_prefs_xml(current if code == 0 and "<map" in current else EMPTY_PREFS, updates)
+
+    fd, local = tempfile.mkstemp(suffix=".xml")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(document)
+        staged = f"{DEVICE_TMP}/{package}_{name}.xml"
+        d.push(local, staged)
+    finally:
+        os.remove(local)
+
+    data_dir = f"/data/data/{package}"
+    # The exit status is the copy's, not the cleanup's
+    _, code = su(d, f"am force-stop {package}; mkdir -p {data_dir}/shared_prefs && "
+                    f"cp {staged} {path} && owner=$(stat -c %u:%g {data_dir}) && "
+                    f"chown $owner {data_dir}/shared_prefs {path} && chmod 660 {path}; status=$?; "
+                    f"restorecon -R {data_dir}/shared_prefs; rm -f {staged}; exit $status")
+    if code != 0:
+        return False
+    written = read_prefs(d, package, name)
+    return all(written.get(key) == (set(value) if isinstance(value, list) else value)
+               for key, value in updates.items())
@@ -0,0 +1,141 @@
+import collections
+import contextlib
+import functools
+import sys
+import threading
+import time
+
+import cancellation
+import journal
+
+# RPC and sleep accounting for the UI helpers.
+#
+# Device round trips are already journaled by the InstrumentedDevice proxy.
+# install_sleep_hook() makes time.sleep journal its callers too, until the
+# matching remove_sleep_hook(); helper() tags everything a helper function
+# does with its name, and timeout_expired() marks waits that gave up.
+# Accounting listens to these events while a flow runs and prints, per flow
+# step and helper, how many RPCs were made, how long they took, how much time
+# went to sleeping and how many timeouts expired.
+
+_hook_lock = threading.Lock()
+# Open install_sleep_hook() calls, and the time.sleep from before the first
+_hook_users = 0
+_saved_sleep = None
+
+
+def _accounted_sleep(seconds):
+    start = time.time()
+    try:
+        # Still ends early when the run is cancelled
+        cancellation.sleep(seconds)
+    finally:
+        journal.event("sleep", caller=sys._getframe(1).f_code.co_name, duration=round(time.time() - start, 4))
+
+
+def install_sleep_hook():
+    """Route time.sleep (for every module using `time.sleep(...)`) through the journal.
+
+    Calls nest; the last remove_sleep_hook() puts the previous time.sleep
+    back. Cancellation's hook goes in underneath first, so time.sleep stays
+    cancellable after the accounting ends.
+    """
+    global _hook_users, _saved_sleep
+    with _hook_lock:
+        if _hook_users == 0:
+            cancellation.install_sleep_hook()
+            _saved_sleep = time.sleep
+            time.sleep = _accounted_sleep
+        _hook_users += 1
+
+
+def remove_sleep_hook():
+    global _hook_users
+    with _hook_lock:
+        _hook_users -= 1
+        if _hook_users == 0 and time.sleep is _accounted_sleep:
+            time.sleep = _saved_sleep
+
+
+def helper(fn):
+    """Attribute the RPCs, sleeps and timeouts inside fn to it."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with journal.context(helper=fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def timeout_expired(what, timeout):
+    journal.event("timeout", what=str(what), timeout=timeout)
+
+
+class Accounting:
+    """Per (step, helper) totals of the journal events of one flow run."""
+
+    def __init__(self, title, serial=None):
+        self.title = title
+        self.serial = serial
+        self.rows = collections.defaultdict(lambda: {"rpcs": 0, "rpc_time": 0.0, "sleeps": 0,
+                                                     "sleep_time": 0.0, "timeouts": 0})
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        kind = record["kind"]
+        if kind not in ("u2", "sleep", "timeout"):
+            return
+        if self.serial is not None and record.get("serial") not in (self.serial, None):
+            return
+        # No step: background threads of a flow (popup watcher, keep-alive)
+        key = (record.get("step", "(no step)"), record.get("helper", "-"))
+        with self._lock:
+            row = self.rows[key]
+            if kind == "u2":
+                row["rpcs"] += 1
+                row["rpc_time"] += record.get("duration", 0)
+            elif kind == "sleep":
+                row["sleeps"] += 1
+                row["sleep_time"] += record.get("duration", 0)
+            else:
+                row["timeouts"] += 1
+
+    def start(self):
+        install_sleep_hook()
+        journal.add_listener(self)
+        return self
+
+    def stop(self):
+        journal.remove_listener(self)
+        remove_sleep_hook()
+
+    def table(self):
+        """The summary table as text lines."""
+        with self._lock:
+            rows = list(self.rows.items())
+        if not rows:
+            return []
+        width = max(len(f"{step} / {name}") for (step, name), _ in rows)
+        width = max(width, len("Total"), len("Step / helper"))
+        lines = [f"📊 RPC and sleep accounting for '{self.title}':",
+                 f"   {'Step / helper':<{width}}  {'RPCs':>5}  {'RPC s':>7}  {'Sleeps':>6}  {'Sleep s':>7}  {'Timeouts':>8}"]
+        total = collections.Counter()
+        for (step, name), row in rows:
+            lines.append(f"   {f'{step} / {name}':<{width}}  {row['rpcs']:>5}  {row['rpc_time']:>7.2f}  "
+                         f"{row['sleeps']:>6}  {row['sleep_time']:>7.2f}  {row['timeouts']:>8}")
+            total.update(row)
+        lines.append(f"   {'Total':<{width}}  {total['rpcs']:>5}  {total['rpc_time']:>7.2f}  "
+                     f"{total['sleeps']:>6}  {total['sleep_time']:>7.2f}  {total['timeouts']:>8}")
+        return lines
+
+
+@contextlib.contextmanager
+def accounting(title, serial=None, log=print):
+    """Account the block and log the summary table at its end."""
+    acct = Accounting(title, serial).start()
+    try:
+        yield acct
+    finally:
+        acct.stop()
+        lines = acct.table()
+        if lines:
+            log("\n".join(lines))
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+from collections import deque
+
+# Screen-state recognition and navigation planning for the UI flows.
+#
+# Known screens and the actions that move between them are data
+# (flows/screens.json). The recognizer maps the current hierarchy snapshot to
+# one of those states and the graph plans the shortest action path from there
+# to a target state, so an interrupted flow resumes where the device is
+# instead of starting over from the home screen.
+
+SCREENS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows", "screens.json")
+
+ANY_STATE = "*"
+
+
+def fingerprint(snapshot, activity=""):
+    """Summarize a snapshot as package, activity and its stable resource ids."""
+    package_counts = {}
+    id_counts = {}
+    for node in snapshot.nodes:
+        package = node.get("package")
+        if package:
+            package_counts[package] = package_counts.get(package, 0) + 1
+        resource_id = node.get("resource-id")
+        if resource_id:
+            id_counts[resource_id] = id_counts.get(resource_id, 0) + 1
+    # Ids that repeat are list rows whose number depends on content and scroll
+    # position; only ids that occur once describe the screen itself.
+    stable_ids = sorted(rid for rid, count in id_counts.items() if count == 1)
+    package = max(package_counts, key=package_counts.get) if package_counts else ""
+    return {"package": package, "activity": activity or "", "ids": stable_ids}
+
+
+def fingerprint_key(fp):
+    """Short hash of a fingerprint, usable as a checkpoint id."""
+    raw = "|".join([fp["package"], fp["activity"]] + fp["ids"])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class ScreenRecognizer:
+    """Matches snapshots against state definitions.
+
+    A state definition may use any of:
+      package / packageMatches  foreground package (exact / regex)
+      activityMatches           regex on the current activity
+      ids                       resource ids that must all be present
+      all                       selectors that must all match
+      absent                    selectors that must not match
+    The matching state with the most criteria wins.
+    """
+
+    def __init__(self, states):
+        self.states = states
+        self.needs_activity = any("activityMatches" in s for s in states.values())
+
+    def matches(self, definition, snapshot, fp):
+        if "package" in definition and definition["package"] not in snapshot.packages():
+            return False
+        if "packageMatches" in definition:
+            pattern = re.compile(definition["packageMatches"])
+            if not any(pattern.fullmatch(p) for p in snapshot.packages()):
+                return False
+        if "activityMatches" in definition and not re.fullmatch(definition["activityMatches"], fp["activity"]):
+            return False
+        present_ids = {n.get("resource-id") for n in snapshot.nodes}
+        if any(rid not in present_ids for rid in definition.get("ids", [])):
+            return False
+        if any(snapshot.find(selector) is None for selector in definition.get("all", [])):
+            return False
+        if any(snapshot.find(selector) is not None for selector in definition.get("absent", [])):
+            return False
+        return True
+
+    def identify(self, snapshot, activity=""):
+        """Return the name of the best matching state, or None if unknown."""
+        fp = fingerprint(snapshot, activity)
+        best, best_score = None, -1
+        for name, definition in self.states.items():
+            if not self.matches(definition, snapshot, fp):
+                continue
+            score = sum(len(v) if isinstance(v, list) else 1
+                        for k, v in definition.items() if k != "description")
+            if score > best_score:
+                best, best_score = name, score
+        return best
+
+
+class NavigationGraph:
+    """Directed graph of screen states; edges carry the flow steps to perform."""
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    def outgoing(self, state):
+        return [(i, e) for i, e in enumerate(self.edges) if e["from"] in (state, ANY_STATE)]
+
+    def plan(self, start, target, exclude=()):
+        """Breadth-first shortest path of edge indices from start to target."""
+        if start == target:
+            return []
+        queue = deque([(start, [])])
+        seen = {start}
+        while queue:
+            state, path = queue.popleft()
+            for index, edge in self.outgoing(state):
+                if index in exclude or edge["to"] in seen:
+                    continue
+                new_path = path + [index]
+                if edge["to"] == target:
+                    return new_path
+                seen.add(edge["to"])
+                queue.append((edge["to"], new_path))
+        return None
+
+
+def load_screens(path=SCREENS_FILE, texts=None):
+    """Load state definitions and edges; return (ScreenRecognizer, NavigationGraph).
+
+    texts (a ui_locale.LocaleTexts) resolves localized element references.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if texts is not None:
+        data = texts.resolve(data)
+    return ScreenRecognizer(data["states"]), NavigationGraph(data["edges"])
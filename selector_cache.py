@@ -0,0 +1,40 @@
+import os
+
+import device_props
+from json_store import JsonStore
+from ui_runtime import selector_key
+
+# Learned selector order per device profile.
+#
+# For every flow step the cache counts which selector variant actually
+# matched, keyed by "<model>|<android version>|<launcher package>". Later
+# runs on the same kind of device try the winning variant first.
+
+CACHE_FILE = os.path.join("pico_state", "selector_cache.json")
+
+
+def device_profile(d):
+    """Return the cache key for a device: model, Android version and launcher."""
+    return device_props.for_device(d).profile()
+
+
+class SelectorOrderCache(JsonStore):
+    """Persistent per-profile, per-step hit counts of selector variants."""
+
+    def __init__(self, path=CACHE_FILE):
+        super().__init__(path)
+
+    def order(self, profile, step_id, selectors):
+        """Return the selectors with previously winning variants first (stable otherwise)."""
+        hits = self._data.get(profile, {}).get(step_id, {})
+        if not hits:
+            return list(selectors)
+        ranked = sorted(enumerate(selectors), key=lambda item: (-hits.get(selector_key(item[1]), 0), item[0]))
+        return [selector for _, selector in ranked]
+
+    def record(self, profile, step_id, selector):
+        with self._lock:
+            step_hits = self._data.setdefault(profile, {}).setdefault(step_id, {})
+            key = selector_key(selector)
+            step_hits[key] = step_hits.get(key, 0) + 1
+            self._dirty = True
@@ -0,0 +1,78 @@
+import root_prefs
+from device_shell import has_root
+
+# Fast-path SuperSU configuration.
+#
+# Default access = Grant and Show notifications are plain SharedPreferences of
+# the SuperSU app, so they are written over an `su` shell instead of launching
+# SuperSU, dismissing its first-run popups and scrolling through SETTINGS.
+# Whether SuperSU honours them is checked by its behaviour, not by reading the
+# file back: a UID that never asked for root must get it without a prompt.
+# supersu.py falls back to the UI flow if this fails.
+
+SUPERSU_PACKAGE = "eu.chainfire.supersu"
+PREFS_NAME = f"{SUPERSU_PACKAGE}_preferences"
+
+# Settings → Default access = Grant, Show notifications on. The key names are
+# not confirmed on every SuperSU version (python supersu_config.py --show-prefs
+# lists a device's), which is why success is judged by default_grant_works().
+SUPERSU_PREFS = {
+    "config_default_access": "grant",
+    "config_default_notify": True,
+}
+
+# AID_NOBODY: a UID SuperSU has no stored decision for
+PROBE_UID = 9999
+# As root, switch to PROBE_UID and ask for root again: uid=0 only if Default
+# access = Grant is in effect; otherwise SuperSU prompts or denies.
+DEFAULT_GRANT_CHECK = f"su -c 'su {PROBE_UID} -c \"su -c id\"'"
+GRANT_CHECK_TIMEOUT = 15
+
+
+def default_grant_works(d):
+    """True if SuperSU grants root to a new UID without prompting."""
+    try:
+        output = d.shell(["sh", "-c", DEFAULT_GRANT_CHECK], timeout=GRANT_CHECK_TIMEOUT).output
+    except Exception:
+        output = ""
+    if "uid=0" in output:
+        return True
+    # Don't leave a pending root prompt on the screen
+    d.shell(["am", "force-stop", SUPERSU_PACKAGE])
+    return False
+
+
+def configure_supersu(d, log=print, grants_by_default=None):
+    """Write SuperSU's default access and notification settings as root; True if root is then granted by default.
+
+    grants_by_default is the result of a default_grant_works() the caller has
+    just run, so a device that needs configuring isn't made to wait out the
+    check twice.
+    """
+    if not has_root(d):
+        log("   SuperSU fast path needs root; using the UI flow.")
+        return False
+    if grants_by_default is None:
+        grants_by_default = default_grant_works(d)
+    if grants_by_default:
+        log("✅ SuperSU already grants root by default.")
+        return True
+    if not root_prefs.write_prefs(d, SUPERSU_PACKAGE, PREFS_NAME, SUPERSU_PREFS):
+        log("   SuperSU settings could not be written; using the UI flow.")
+        return False
+    if not default_grant_works(d):
+        log("   SuperSU did not apply the written settings; using the UI flow.")
+        return False
+    log(f"✅ SuperSU configured: {SUPERSU_PREFS}")
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    from device_session import get_device
+    device = get_device()
+    if "--show-prefs" in sys.argv:
+        for key, value in sorted(root_prefs.read_prefs(device, SUPERSU_PACKAGE, PREFS_NAME).items()):
+            print(f"{key} = {value!r}")
+        sys.exit(0)
+    sys.exit(0 if configure_supersu(device) else 1)
@@ -0,0 +1,187 @@
+import contextlib
+import os
+import shlex
+import time
+from xml.sax.saxutils import escape
+
+import cancellation
+import device_props
+import device_session
+from json_store import JsonStore
+from screen_state import fingerprint
+
+# Compiled on-device tap scripts.
+#
+# A successful run of a deterministic flow (the OpenVPN profile import) is
+# recorded as the taps, swipes, key presses and app starts it sent, each with
+# a checkpoint: the package and a few stable resource ids of the screen it was
+# sent on. Steps whose input depends on what the device shows (a "toggle")
+# spoil the recording. The recording is compiled into one shell
+# script (`input tap` / `input swipe` / `input keyevent`, with a
+# `uiautomator dump` + grep before each action) that later devices of the same
+# model and resolution run in a single adb call. A checkpoint that doesn't
+# show up makes the script exit early and the flow engine falls back to the
+# full flow, which resumes from whatever screen the device is on. Stopping the
+# bring-up kills the script on the device through the pid it records.
+
+SCRIPTS_FILE = os.path.join("pico_state", "tap_scripts.json")
+
+DUMP_PATH = "/data/local/tmp/pico_checkpoint.xml"
+PID_PATH = "/data/local/tmp/pico_tap_script.pid"
+DONE_MARKER = "TAP_SCRIPT_DONE"
+FAILED_MARKER = "CHECKPOINT_FAILED"
+
+# Stable ids per checkpoint; more makes the check stricter but more brittle
+CHECKPOINT_IDS = 4
+
+
+def checkpoint(snapshot, node=None):
+    """Greppable description of the screen an action is sent on."""
+    fp = fingerprint(snapshot)
+    check = {"package": fp["package"], "ids": fp["ids"][:CHECKPOINT_IDS]}
+    if node is not None and node.get("text"):
+        check["text"] = node["text"]
+    return check
+
+
+class TapRecorder:
+    """Collects the input a flow sends while it runs on a UiRuntime."""
+
+    def __init__(self, start_state=None):
+        self.start_state = start_state
+        self.actions = []
+        # Cleared when an action turned out to be wrong (a cached tap that
+        # didn't verify, a navigation move that failed): such a run must not
+        # be replayed as is.
+        self.clean = True
+
+    def add(self, action, snapshot=None, node=None):
+        if snapshot is not None:
+            action["check"] = checkpoint(snapshot, node)
+        self.actions.append(action)
+
+    def spoil(self):
+        self.clean = False
+
+    def finish(self, snapshot):
+        """Return the recording, ending with a checkpoint on the final screen."""
+        return {"start_state": self.start_state, "actions": self.actions,
+                "final": checkpoint(snapshot), "recorded": int(time.time())}
+
+
+def _dump_attr(name, value):
+    """name="value" as uiautomator writes it: always in double quotes, with &, <, > and " escaped."""
+    return name + '="' + escape(value, {'"': "&quot;"}) + '"'
+
+
+def _check_patterns(check):
+    patterns = [_dump_attr("package", check["package"])] if check.get("package") else []
+    patterns += [_dump_attr("resource-id", rid) for rid in check.get("ids", [])]
+    if check.get("text"):
+        patterns.append(_dump_attr("text", check["text"]))
+    return " ".join(shlex.quote(p) for p in patterns)
+
+
+def _command(action):
+    kind = action["type"]
+    if kind == "tap":
+        return f"input tap {action['x']} {action['y']}"
+    if kind == "swipe":
+        return (f"input swipe {action['x1']} {action['y1']} {action['x2']} {action['y2']} "
+                f"{int(action.get('duration', 0.2) * 1000)}")
+    if kind == "key":
+        return f"input keyevent {shlex.quote('KEYCODE_' + action['key'].upper())}"
+    if kind == "app":
+        return f"monkey -p {shlex.quote(action['package'])} -c android.intent.category.LAUNCHER 1 >/dev/null 2>&1"
+    if kind == "intent":
+        return f"am start -a {shlex.quote(action['intent'])} >/dev/null 2>&1"
+    raise ValueError(f"Unknown recorded action '{kind}'")
+
+
+def compile_script(recording, checkpoint_tries=10):
+    """Compile a recording into one POSIX shell script for `adb shell`.
+
+    The first checkpoint gets a single try: the device is expected to be on
+    the recorded start screen already, and a mismatch should cost one dump.
+    """
+    lines = [
+        f"echo $$ > {PID_PATH}",
+        f"F={DUMP_PATH}",
+        "checkpoint() {",
+        "  step=$1; tries=$2; shift 2",
+        "  while [ $tries -gt 0 ]; do",
+        "    if uiautomator dump $F >/dev/null 2>&1; then",
+        "      ok=1",
+        "      for p in \"$@\"; do grep -qF -- \"$p\" $F || { ok=0; break; }; done",
+        "      [ $ok = 1 ] && return 0",
+        "    fi",
+        "    tries=$((tries - 1)); sleep 1",
+        "  done",
+        f"  echo \"{FAILED_MARKER} $step\"; rm -f $F; exit 10",
+        "}",
+    ]
+    for step, action in enumerate(recording["actions"], 1):
+        if "check" in action:
+            tries = 1 if step == 1 else checkpoint_tries
+            lines.append(f"checkpoint {step} {tries} {_check_patterns(action['check'])}")
+        else:
+            lines.append("sleep 1")
+        lines.append(_command(action))
+    lines.append(f"checkpoint final {checkpoint_tries} {_check_patterns(recording['final'])}")
+    lines.append("rm -f $F")
+    lines.append(f"echo {DONE_MARKER}")
+    return "\n".join(lines) + "\n"
+
+
+def release_uiautomator(d):
+    """Stop the uiautomator2 agent so `uiautomator dump` can attach; u2 restarts it on the next call."""
+    try:
+        if hasattr(d, "stop_uiautomator"):
+            d.stop_uiautomator()
+        elif hasattr(d, "uiautomator"):
+            d.uiautomator.stop()
+    except Exception:
+        pass
+
+
+def run_script(d, script, timeout=300):
+    """Run a compiled script in one shell call; return (ok, failed checkpoint or None).
+
+    The shell call can't be interrupted from here, so a cancelled bring-up
+    kills the script on the device instead; the call then returns and
+    Cancelled is raised. The agent is stopped for the script's `uiautomator
+    dump`; a device from device_session gets it started again afterwards.
+    """
+    session = device_session.session_of(d)
+    kill = ["adb", "-s", device_props.device_serial(d), "shell", f"kill $(cat {PID_PATH}) 2>/dev/null"]
+    with session.agent_paused() if session is not None else contextlib.nullcontext():
+        release_uiautomator(d)
+        with cancellation.on_cancel(kill):
+            output = d.shell(["sh", "-c", script], timeout=timeout).output
+    cancellation.check()
+    if DONE_MARKER in output:
+        return True, None
+    for line in output.splitlines():
+        if line.startswith(FAILED_MARKER):
+            return False, line[len(FAILED_MARKER):].strip()
+    return False, "unknown"
+
+
+class TapScriptStore(JsonStore):
+    """Persistent recordings per profile (model, resolution, language), keyed by flow and start screen."""
+
+    def __init__(self, path=SCRIPTS_FILE):
+        super().__init__(path)
+
+    def get(self, profile, flow_name):
+        return self._data.get(profile, {}).get(flow_name)
+
+    def put(self, profile, flow_name, recording):
+        with self._lock:
+            self._data.setdefault(profile, {})[flow_name] = recording
+            self._dirty = True
+
+    def invalidate(self, profile, flow_name):
+        with self._lock:
+            if self._data.get(profile, {}).pop(flow_name, None) is not None:
+                self._dirty = True
@@ -0,0 +1,75 @@
+from device_props import SEPARATOR
+from device_state import DeviceState
+
+PACKAGE_SECTION = """@@az.osmdroidprop
+    versionCode=42 minSdk=21 targetSdk=28
+    requested permissions:
+      android.permission.CAMERA
+      android.permission.INTERNET
+    install permissions:
+      android.permission.INTERNET: granted=true
+    runtime permissions:
+      android.permission.CAMERA: granted=true
+"""
+
+PREFS_SECTION = """@@net.openvpn.openvpn/net.openvpn.openvpn_preferences
+<?xml version='1.0' encoding='utf-8' standalone='yes' ?>
+<map>
+    <boolean name="reconnect" value="true" />
+</map>
+"""
+
+SECTIONS = [
+    "/dev/block/system /system ext4 rw,seclabel,relatime 0 0\n",
+    PACKAGE_SECTION,
+    "/sdcard/Kandel/1_Kandel_setup.sh\n",
+    PREFS_SECTION,
+    "/data/data/net.openvpn.openvpn/files/profile\n",
+    "script_1\nreboot\n",
+    "b0a1-boot\n",
+    "1_Kandel_setup.sh\n",
+]
+
+
+def probe_output(sections):
+    return f"\n{SEPARATOR}\n".join(sections)
+
+
+def test_full_probe():
+    state = DeviceState.parse(probe_output(SECTIONS))
+    assert state.system_rw
+    assert state.versions == {"az.osmdroidprop": 42}
+    assert state.requested["az.osmdroidprop"] == {"android.permission.CAMERA", "android.permission.INTERNET"}
+    assert state.granted["az.osmdroidprop"] == {"android.permission.CAMERA"}
+    assert state.files == {"/sdcard/Kandel/1_Kandel_setup.sh"}
+    assert state.prefs_match("net.openvpn.openvpn", "net.openvpn.openvpn_preferences", {"reconnect": True})
+    assert state.openvpn_profile_imported
+    assert state.markers == {"script_1", "reboot"}
+    assert state.boot_id == "b0a1-boot"
+    assert state.scripts_done == {"1_Kandel_setup.sh"}
+    assert state.permissions_granted("az.osmdroidprop")
+
+
+def test_truncated_probe():
+    # The connection dropped inside the preferences file
+    output = probe_output(SECTIONS[:3] + [PREFS_SECTION[:PREFS_SECTION.index("<boolean")]])
+    state = DeviceState.parse(output)
+    assert state.versions == {"az.osmdroidprop": 42}
+    assert state.prefs == {"net.openvpn.openvpn/net.openvpn.openvpn_preferences": {}}
+    assert not state.openvpn_profile_imported
+    assert state.markers == set()
+    assert state.boot_id is None
+    assert state.scripts_done == set()
+
+
+def test_failed_probe():
+    state = DeviceState.parse(None)
+    assert not state.system_rw
+    assert state.versions == {}
+    assert not state.permissions_granted("az.osmdroidprop")
+
+
+def test_no_requested_permissions_is_not_granted():
+    section = "@@az.osmdroidprop\n    versionCode=42 minSdk=21 targetSdk=28\n"
+    state = DeviceState.parse(probe_output(["", section]))
+    assert not state.permissions_granted("az.osmdroidprop")
@@ -0,0 +1,43 @@
+import root_prefs
+from device_shell import ShellResult
+
+
+class FakeDevice:
+    """Answers su shell calls with a fixed (output, exit code)."""
+
+    def __init__(self, output, exit_code=0):
+        self.result = ShellResult(output, exit_code)
+        self.commands = []
+
+    def shell(self, command, timeout=60):
+        self.commands.append(command)
+        return self.result
+
+
+def test_round_trip_bool_int_string():
+    updates = {"notify": True, "retries": 3, "access": "grant", "quiet": False}
+    document = root_prefs.update_prefs_xml(root_prefs.EMPTY_PREFS, updates)
+    assert root_prefs.parse_prefs(document) == updates
+
+
+def test_update_replaces_keys_and_keeps_others():
+    document = root_prefs.update_prefs_xml(root_prefs.EMPTY_PREFS, {"a": "x", "b": 1})
+    document = root_prefs.update_prefs_xml(document, {"b": True, "c": "it's <&\"quoted\">"})
+    assert root_prefs.parse_prefs(document) == {"a": "x", "b": True, "c": "it's <&\"quoted\">"}
+    assert document.count('name="b"') == 1
+
+
+def test_update_without_a_map_starts_empty():
+    document = root_prefs.update_prefs_xml("cat: No such file or directory", {"a": 1})
+    assert root_prefs.parse_prefs(document) == {"a": 1}
+
+
+def test_missing_prefs_file_reads_empty():
+    d = FakeDevice("cat: /data/data/x/shared_prefs/x_preferences.xml: No such file or directory\n", 1)
+    assert root_prefs.read_prefs(d, "x", "x_preferences") == {}
+    assert d.commands == [["su", "-c", "cat /data/data/x/shared_prefs/x_preferences.xml"]]
+
+
+def test_read_prefs_skips_leading_output():
+    d = FakeDevice("WARNING: linker: something\n" + root_prefs.update_prefs_xml(root_prefs.EMPTY_PREFS, {"k": 7}))
+    assert root_prefs.read_prefs(d, "x", "x_preferences") == {"k": 7}
@@ -0,0 +1,44 @@
+import shlex
+
+from tap_script import compile_script
+
+# Lines of a uiautomator dump, attributes as uiautomator escapes them
+DUMP = ('<node index="0" text="Say &quot;hi&quot; &amp; it\'s &lt;ok&gt;" resource-id="com.x:id/title" '
+        'class="android.widget.TextView" package="com.x" content-desc="" bounds="[0,0][10,10]" />\n'
+        '<node index="1" text="" resource-id="com.x:id/list" class="android.widget.ListView" package="com.x" '
+        'content-desc="" bounds="[0,0][10,10]" />\n')
+
+RECORDING = {
+    "actions": [
+        {"type": "tap", "x": 5, "y": 5,
+         "check": {"package": "com.x", "ids": ["com.x:id/title", "com.x:id/list"],
+                   "text": "Say \"hi\" & it's <ok>"}},
+        {"type": "key", "key": "home"},
+    ],
+    "final": {"package": "com.x", "ids": ["com.x:id/list"]},
+}
+
+
+def checkpoint_lines(script):
+    return [shlex.split(line) for line in script.splitlines() if line.startswith("checkpoint ")]
+
+
+def test_checkpoint_patterns_match_the_dump():
+    checkpoints = checkpoint_lines(compile_script(RECORDING))
+    assert [c[1] for c in checkpoints] == ["1", "final"]
+    for checkpoint in checkpoints:
+        for pattern in checkpoint[3:]:
+            assert pattern in DUMP
+    assert 'text="Say &quot;hi&quot; &amp; it\'s &lt;ok&gt;"' in checkpoints[0]
+
+
+def test_checkpoint_tries():
+    checkpoints = checkpoint_lines(compile_script(RECORDING, checkpoint_tries=4))
+    assert [c[2] for c in checkpoints] == ["1", "4"]
+
+
+def test_actions_follow_their_checkpoints():
+    lines = compile_script(RECORDING).splitlines()
+    tap = lines.index("input tap 5 5")
+    assert lines[tap - 1].startswith("checkpoint 1 ")
+    assert lines[lines.index("input keyevent KEYCODE_HOME") - 1] == "sleep 1"
@@ -0,0 +1,107 @@
+import math
+import os
+import threading
+
+import device_props
+import journal
+from json_store import JsonStore
+
+# Observed step durations and the timeouts learned from them.
+#
+# A journal listener records the duration of every successful bring-up stage
+# (Kandel scripts, reboot, ...) and UI flow step per device model in
+# pico_state/timings.json. Once a step has enough history, timeout_for()
+# replaces its hardcoded timeout with a multiple of the observed 95th
+# percentile: a hung 1_Kandel_setup.sh is given up on after about 1.5x its
+# usual run time instead of after 600 s, and a model that is consistently
+# slower than the default gets more time instead of being failed early.
+# poll_interval() scales how often long steps are polled the same way.
+
+TIMINGS_FILE = os.path.join("pico_state", "timings.json")
+
+# Most recent durations kept per model and step
+MAX_SAMPLES = 50
+# Fewer runs than this and the hardcoded defaults apply
+MIN_SAMPLES = 5
+
+
+def percentile(samples, q):
+    """Nearest-rank q-th percentile (0 < q <= 100) of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def step_key(record):
+    """'<flow>/<step>' of a step_end event, 'bringup/<stage>' of a stage_end event."""
+    return f"{record.get('flow') or 'bringup'}/{record.get('step')}"
+
+
+class TimingHistory(JsonStore):
+    """Persistent recent durations per device model and step key."""
+
+    def __init__(self, path=TIMINGS_FILE):
+        super().__init__(path)
+
+    def record(self, model, key, duration):
+        with self._lock:
+            samples = self._data.setdefault(model or "unknown", {}).setdefault(key, [])
+            samples.append(round(duration, 2))
+            del samples[:-MAX_SAMPLES]
+            self._dirty = True
+
+    def samples(self, model, key):
+        with self._lock:
+            return list(self._data.get(model or "unknown", {}).get(key, []))
+
+    def timeout_for(self, model, key, default, factor=1.5, margin=0.0, floor=0.0, ceiling=3.0):
+        """Learned timeout: factor * p95 + margin, kept within [floor, ceiling * default].
+
+        The default until MIN_SAMPLES runs of the step are known on this model.
+        """
+        samples = self.samples(model, key)
+        if len(samples) < MIN_SAMPLES:
+            return default
+        learned = factor * percentile(samples, 95) + margin
+        return min(max(learned, floor), ceiling * default)
+
+    def poll_interval(self, model, key, default, fraction=0.02, low=1.0, high=30.0):
+        """Poll about fraction of the median duration apart, within [low, high]."""
+        samples = self.samples(model, key)
+        if len(samples) < MIN_SAMPLES:
+            return default
+        return min(max(fraction * percentile(samples, 50), low), high)
+
+
+class TimingRecorder:
+    """Journal listener recording successful stage and flow step durations."""
+
+    def __init__(self, history):
+        self.history = history
+        # Last known model per serial; the reboot drops the cached properties
+        self.models = {}
+
+    def __call__(self, record):
+        kind = record["kind"]
+        if kind in ("stage_end", "step_end") and record.get("ok") and record.get("step"):
+            serial = record.get("serial")
+            props = device_props.cached(serial)
+            if props is not None:
+                self.models[serial] = props.model
+            self.history.record(self.models.get(serial), step_key(record), record.get("duration", 0))
+        # Stages are minutes apart and a flow's steps end with it; save then
+        if kind in ("stage_end", "flow_end"):
+            self.history.save()
+
+
+_history = None
+_lock = threading.Lock()
+
+
+def get_history():
+    """The process-wide TimingHistory, recording from the first call."""
+    global _history
+    with _lock:
+        if _history is None:
+            _history = TimingHistory()
+            journal.add_listener(TimingRecorder(_history))
+        return _history
@@ -0,0 +1,142 @@
+import collections
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+
+import journal
+
+# Chrome trace / Perfetto timeline of a run.
+#
+# Built from journal events: everything with a duration (bring-up stages, flows
+# and flow steps, adb commands, uiautomator2 calls, sleeps) becomes a span;
+# UI input actions and expired timeouts become instant events. Each device is
+# one process in the timeline, with one track per kind of work and thread (the
+# popup watcher's uiautomator2 calls run beside the flow's), so a whole fleet
+# run shows where each device's time went. Open the output in
+# chrome://tracing or https://ui.perfetto.dev.
+#
+#   python trace_export.py [journal.jsonl[.gz] ...] [-o trace.json]
+#
+# converts journal files after the fact; TraceCollector records a run live.
+
+# Journal event kind -> (track, name field)
+SPAN_KINDS = {
+    "bringup_end": ("bring-up", "serial"),
+    "stage_end": ("stages", "step"),
+    "flow_end": ("flows", "flow"),
+    "step_end": ("flow steps", "step"),
+    "adb": ("adb", "command"),
+    "u2": ("uiautomator2", "call"),
+    "sleep": ("sleep", "caller"),
+}
+INSTANT_KINDS = {"ui": ("uiautomator2", "action"), "timeout": ("sleep", "what")}
+TRACK_ORDER = ["bring-up", "stages", "flows", "flow steps", "adb", "uiautomator2", "sleep"]
+
+# Fields that are already the span's position or name
+_SKIP_ARGS = {"ts", "kind", "duration", "serial", "thread"}
+
+
+def to_chrome_trace(records):
+    """Build the Chrome trace JSON object for a list of journal records."""
+    pids = {}
+    # (pid, track, thread) -> tid
+    tids = {}
+    events = []
+    for record in records:
+        kind = record.get("kind")
+        track, name_field = SPAN_KINDS.get(kind) or INSTANT_KINDS.get(kind) or (None, None)
+        if track is None:
+            continue
+        serial = record.get("serial") or "host"
+        pid = pids.setdefault(serial, len(pids) + 1)
+        event = {
+            "name": str(record.get(name_field) or kind),
+            "cat": kind,
+            "pid": pid,
+            "tid": tids.setdefault((pid, track, record.get("thread")), len(tids) + 1),
+            "args": {k: v for k, v in record.items() if k not in _SKIP_ARGS},
+        }
+        if kind in SPAN_KINDS:
+            duration = record.get("duration") or 0
+            # Events are written when the work ends
+            event.update(ph="X", ts=round((record["ts"] - duration) * 1e6), dur=round(duration * 1e6))
+        else:
+            event.update(ph="i", s="t", ts=round(record["ts"] * 1e6))
+        events.append(event)
+
+    for serial, pid in pids.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": serial}})
+    threads = collections.Counter((pid, track) for pid, track, _ in tids)
+    for (pid, track, thread), tid in tids.items():
+        name = f"{track} ({thread})" if threads[pid, track] > 1 and thread else track
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        events.append({"name": "thread_sort_index", "ph": "M", "pid": pid, "tid": tid,
+                       "args": {"sort_index": TRACK_ORDER.index(track) * 1000 + tid}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_trace(records, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(records), f, ensure_ascii=False, default=str)
+    return path
+
+
+def load_journal(paths):
+    """Records of journal files (plain or gzipped), oldest file first."""
+    records = []
+    for path in sorted(paths, key=os.path.getmtime):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+class TraceCollector:
+    """Keeps the journal events of a run in memory for a trace export."""
+
+    def __init__(self, max_events=500000):
+        self.records = collections.deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        if record["kind"] in SPAN_KINDS or record["kind"] in INSTANT_KINDS:
+            with self._lock:
+                self.records.append(record)
+
+    def start(self):
+        journal.add_listener(self)
+        return self
+
+    def stop(self):
+        journal.remove_listener(self)
+
+    def export(self, path):
+        with self._lock:
+            records = list(self.records)
+        return write_trace(records, path)
+
+
+def main(argv):
+    output = "trace.json"
+    if "-o" in argv:
+        i = argv.index("-o")
+        output = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    base = os.path.join(journal.JOURNAL_DIR, os.path.splitext(journal.JOURNAL_FILE)[0])
+    paths = argv or glob.glob(f"{base}.*.jsonl.gz") + [f"{base}.jsonl"]
+    records = load_journal([p for p in paths if os.path.isfile(p)])
+    write_trace(records, output)
+    print(f"Wrote {len(records)} events to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+import json
+import os
+import re
+
+import device_props
+
+# Locale-aware selectors for the UI flows.
+#
+# Flows refer to logical UI elements ({"textElement": "allow_button"}) instead
+# of hardcoding one language. The device locale comes from the property cache and
+# each element is compiled into a single case-insensitive regex covering the
+# device language plus the fallback language, so a step needs one match pass
+# against one snapshot whatever the build's language is.
+
+TEXTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows", "texts.json")
+
+# Selector keys resolved through the text table, and the key they become
+ELEMENT_KEYS = {
+    "textElement": "textMatches",
+    "descriptionElement": "descriptionMatches",
+}
+
+
+def parse_language(locale):
+    """'ja-JP' / 'ja_JP' / 'ja' -> 'ja'."""
+    return re.split(r"[-_]", locale.strip())[0].lower() if locale and locale.strip() else ""
+
+
+def device_language(d):
+    """Device UI language, from the cached device properties."""
+    for locale in device_props.for_device(d).locales():
+        language = parse_language(locale)
+        if language:
+            return language
+    return ""
+
+
+class LocaleTexts:
+    """Text table for one device language with compiled element patterns."""
+
+    def __init__(self, table, language):
+        self.elements = table["elements"]
+        self.language = language
+        self.fallback = table.get("fallback_language", "en")
+        self._patterns = {}
+
+    @classmethod
+    def load(cls, language, path=TEXTS_FILE):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), language)
+
+    def texts(self, element):
+        if element not in self.elements:
+            raise KeyError(f"Unknown UI text element '{element}'")
+        translations = self.elements[element]
+        texts = list(translations.get(self.language, []))
+        texts += [t for t in translations.get(self.fallback, []) if t not in texts]
+        return texts
+
+    def pattern(self, element):
+        """One regex (uiautomator full-match semantics) for all texts of an element."""
+        if element not in self._patterns:
+            alternatives = "|".join(re.escape(t) for t in self.texts(element))
+            self._patterns[element] = f"(?i)(?:{alternatives})"
+        return self._patterns[element]
+
+    def resolve(self, obj):
+        """Return a copy of a flow/screen definition with element references compiled."""
+        if isinstance(obj, list):
+            return [self.resolve(item) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+        resolved = {}
+        for key, value in obj.items():
+            if key in ELEMENT_KEYS:
+                resolved[ELEMENT_KEYS[key]] = self.pattern(value)
+            else:
+                resolved[key] = self.resolve(value)
+        return resolved
@@ -0,0 +1,420 @@
+import json
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import device_props
+import journal
+import rpc_accounting
+
+# Shared uiautomator2 runtime used by the flow engine.
+#
+# Every lookup is answered from one hierarchy dump (a "snapshot") evaluated
+# locally, instead of one device RPC per selector and per retry.
+
+# Selector attribute names (as used by uiautomator2 / the legacy scripts)
+# mapped to the attribute names found in the hierarchy XML.
+SELECTOR_ATTRS = {
+    "text": "text",
+    "description": "content-desc",
+    "content-desc": "content-desc",
+    "resourceId": "resource-id",
+    "className": "class",
+    "packageName": "package",
+}
+SELECTOR_FLAGS = {
+    "clickable": "clickable",
+    "scrollable": "scrollable",
+    "checkable": "checkable",
+    "checked": "checked",
+    "enabled": "enabled",
+    "focused": "focused",
+    "selected": "selected",
+    "longClickable": "long-clickable",
+}
+SELECTOR_OPS = ("Contains", "Matches", "StartsWith")
+
+_compiled_selectors = {}
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+def _split_selector_key(key):
+    """Return (xml_attribute, op) for a selector key like 'textMatches'."""
+    if key in SELECTOR_ATTRS:
+        return SELECTOR_ATTRS[key], "equals"
+    for op in SELECTOR_OPS:
+        base = key[:-len(op)]
+        if key.endswith(op) and base in SELECTOR_ATTRS:
+            return SELECTOR_ATTRS[base], op
+    raise ValueError(f"Unsupported selector key: {key}")
+
+
+def compile_selector(selector):
+    """Compile a selector dict into a list of node predicates (memoized)."""
+    cache_key = tuple(sorted((k, str(v)) for k, v in selector.items()))
+    predicates = _compiled_selectors.get(cache_key)
+    if predicates is not None:
+        return predicates
+
+    predicates = []
+    for key, value in selector.items():
+        if key in SELECTOR_FLAGS:
+            expected = "true" if value else "false"
+            predicates.append((SELECTOR_FLAGS[key], lambda v, e=expected: v == e))
+            continue
+        attr, op = _split_selector_key(key)
+        if op == "equals":
+            predicates.append((attr, lambda v, e=value: v == e))
+        elif op == "Contains":
+            predicates.append((attr, lambda v, e=value: e in v))
+        elif op == "StartsWith":
+            predicates.append((attr, lambda v, e=value: v.startswith(e)))
+        else:
+            # uiautomator matches the whole attribute (Java String.matches)
+            pattern = re.compile(value, re.DOTALL)
+            predicates.append((attr, lambda v, p=pattern: p.fullmatch(v) is not None))
+
+    _compiled_selectors[cache_key] = predicates
+    return predicates
+
+
+def selector_key(selector):
+    """Stable string form of a selector dict (for caches and registries)."""
+    return json.dumps(selector, sort_keys=True, ensure_ascii=False)
+
+
+def selector_matches(node, selector):
+    """Check a parsed hierarchy node against a selector dict."""
+    return all(test(node.get(attr, "")) for attr, test in compile_selector(selector))
+
+
+def parse_bounds(bounds):
+    """Parse '[l,t][r,b]' into a (left, top, right, bottom) tuple."""
+    m = _BOUNDS_RE.match(bounds or "")
+    if not m:
+        return None
+    return tuple(int(v) for v in m.groups())
+
+
+_ROTATION_RE = re.compile(r'<hierarchy[^>]*\brotation="(\d+)"')
+
+
+def parse_hierarchy(xml_text):
+    """Parse a uiautomator hierarchy dump into a flat list of node dicts."""
+    try:
+        root = ET.fromstring(xml_text)
+    except ET.ParseError:
+        return []
+    nodes = []
+
+    def walk(element, parent):
+        for child in element.findall("node"):
+            node = dict(child.attrib)
+            node["_bounds"] = parse_bounds(node.get("bounds"))
+            # Index of the parent node in the list (None at the top)
+            node["_parent"] = parent
+            nodes.append(node)
+            walk(child, len(nodes) - 1)
+
+    walk(root, None)
+    return nodes
+
+
+def node_center(node):
+    left, top, right, bottom = node["_bounds"]
+    return (left + right) // 2, (top + bottom) // 2
+
+
+def describe_node(node):
+    parts = []
+    if node.get("text"): parts.append(f"text='{node['text']}'")
+    if node.get("resource-id"): parts.append(f"id='{node['resource-id']}'")
+    if node.get("content-desc"): parts.append(f"desc='{node['content-desc']}'")
+    if node.get("clickable") == "true": parts.append("[clickable]")
+    if node.get("scrollable") == "true": parts.append("[scrollable]")
+    return " | ".join(parts)
+
+
+class Snapshot:
+    """One parsed hierarchy dump; all selector checks run against it locally."""
+
+    def __init__(self, xml_text, taken_at=None):
+        self.xml = xml_text
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self.nodes = parse_hierarchy(xml_text)
+        m = _ROTATION_RE.search(xml_text[:200])
+        self.rotation = int(m.group(1)) if m else None
+
+    def find_all(self, selector):
+        return [n for n in self.nodes if n["_bounds"] and selector_matches(n, selector)]
+
+    def find(self, selector):
+        for node in self.nodes:
+            if node["_bounds"] and selector_matches(node, selector):
+                return node
+        return None
+
+    def first_match(self, selectors):
+        """Return (index, node) of the first selector in the list that matches."""
+        for index, selector in enumerate(selectors):
+            node = self.find(selector)
+            if node is not None:
+                return index, node
+        return None, None
+
+    def packages(self):
+        return {n.get("package") for n in self.nodes if n.get("package")}
+
+    def ancestors(self, node):
+        index = node["_parent"]
+        while index is not None:
+            yield index
+            index = self.nodes[index]["_parent"]
+
+    def row_toggle(self, node):
+        """The checkbox or switch of node's row: node itself, or the checkable node under its nearest ancestor with one."""
+        if node.get("checkable") == "true":
+            return node
+        checkables = [(n, set(self.ancestors(n))) for n in self.nodes if n.get("checkable") == "true"]
+        for index in self.ancestors(node):
+            for checkable, above in checkables:
+                if index in above:
+                    return checkable
+        return None
+
+
+class UiRuntime:
+    """Snapshot-based element lookup, clicking and settling for one device."""
+
+    def __init__(self, d, poll_interval=0.3, idle_timeout=3.0, log=print):
+        self.d = d
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.log = log
+        self._snapshot = None
+        self._props = None
+        # Bounds of the last tapped element (a point for coordinate taps)
+        self.last_tap_bounds = None
+        # Optional tap_script.TapRecorder capturing the input sent
+        self.recorder = None
+        # Serializes device access between the flow and background helpers
+        # (e.g. the popup watcher) that share this runtime.
+        self.lock = threading.RLock()
+
+    # --- Snapshots ---
+
+    def snapshot(self, max_age=0.0):
+        """Return a hierarchy snapshot, reusing the last one if fresh enough."""
+        with self.lock:
+            snap = self._snapshot
+            if snap is not None and time.time() - snap.taken_at <= max_age:
+                return snap
+            self._snapshot = Snapshot(self.d.dump_hierarchy(compressed=False))
+            if self._props is not None and self._snapshot.rotation is not None:
+                self._props.rotated(self._snapshot.rotation)
+            return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    @rpc_accounting.helper
+    def wait_idle(self, timeout=None):
+        """Wait until two consecutive dumps are identical (UI has settled)."""
+        timeout = self.idle_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        previous = self.snapshot()
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            current = self.snapshot()
+            if current.xml == previous.xml:
+                return current
+            previous = current
+        rpc_accounting.timeout_expired("wait_idle", timeout)
+        return previous
+
+    @rpc_accounting.helper
+    def wait_for_any(self, selectors, timeout=5.0):
+        """Poll snapshots until one of the selectors matches; return (index, node)."""
+        deadline = time.time() + timeout
+        while True:
+            index, node = self.snapshot().first_match(selectors)
+            if node is not None:
+                return index, node
+            if time.time() >= deadline:
+                rpc_accounting.timeout_expired(selectors, timeout)
+                return index, node
+            time.sleep(self.poll_interval)
+
+    # --- Actions ---
+
+    def display_size(self):
+        """Display size from the device property cache (re-read after a rotation)."""
+        self._props = device_props.for_device(self.d)
+        return self._props.display_size
+
+    def record(self, action, node=None):
+        """Journal an input action and pass it to the recorder with the screen it is sent on."""
+        journal.event("ui", action=action["type"], target=describe_node(node) if node is not None else None,
+                      input={k: v for k, v in action.items() if k != "type"})
+        if self.recorder is not None:
+            self.recorder.add(action, self._snapshot, node)
+
+    def _tap(self, x, y, node=None):
+        with self.lock:
+            self.record({"type": "tap", "x": x, "y": y}, node)
+            self.d.click(x, y)
+            self.invalidate()
+            self.last_tap_bounds = node["_bounds"] if node is not None else (x, y, x, y)
+
+    def tap(self, x, y, settle=True):
+        self._tap(x, y)
+        if settle:
+            self.wait_idle()
+
+    def tap_fraction(self, fx, fy, settle=True):
+        width, height = self.display_size()
+        self.tap(int(width * fx), int(height * fy), settle=settle)
+
+    def click_node(self, node, settle=True):
+        self._tap(*node_center(node), node=node)
+        if settle:
+            self.wait_idle()
+
+    def press(self, key, settle=True):
+        with self.lock:
+            self.record({"type": "key", "key": key})
+            self.d.press(key)
+            self.invalidate()
+        if settle:
+            self.wait_idle()
+
+    def click_current(self, selectors, max_age=float("inf")):
+        """Tap the first selector matching the current snapshot; return (index, node).
+
+        Runs under the lock, so a background helper (the popup watcher) can't
+        tap between the match and the tap. If it tapped since the snapshot was
+        taken, the snapshot is gone and the match is made on a fresh dump; node
+        is None if nothing matches anymore.
+        """
+        with self.lock:
+            index, node = self.snapshot(max_age=max_age).first_match(selectors)
+            if node is not None:
+                self.click_node(node, settle=False)
+            return index, node
+
+    @rpc_accounting.helper
+    def click_any(self, selectors, description="", timeout=5.0):
+        """Click the first selector that matches; return that selector or None."""
+        deadline = time.time() + timeout
+        while True:
+            index, node = self.wait_for_any(selectors, timeout=max(deadline - time.time(), 0))
+            if node is not None:
+                index, node = self.click_current(selectors)
+            if node is not None or time.time() >= deadline:
+                break
+        if node is None:
+            self.log(f"🚫 Not found: {description or selectors}")
+            return None
+        self.wait_idle()
+        self.log(f"👍 Clicked: {description or selectors[index]} ({describe_node(node)})")
+        return selectors[index]
+
+    def scroll(self, direction="forward", container=None):
+        """Swipe once inside the scrollable container (or the largest scrollable node)."""
+        if container is None:
+            container = scroll_container(self.snapshot())
+        if container is None:
+            return False
+        left, top, right, bottom = container["_bounds"]
+        x = (left + right) // 2
+        upper = top + (bottom - top) // 5
+        lower = bottom - (bottom - top) // 5
+        y1, y2 = (lower, upper) if direction == "forward" else (upper, lower)
+        with self.lock:
+            self.record({"type": "swipe", "x1": x, "y1": y1, "x2": x, "y2": y2, "duration": 0.2})
+            self.d.swipe(x, y1, x, y2, 0.2)
+            self.invalidate()
+        return True
+
+    @rpc_accounting.helper
+    def scroll_find(self, targets, description="", max_scrolls=5, directions=("forward",), initial_wait=2.0,
+                    click=True):
+        """Scroll through a list until a target is visible, click it (unless click=False) and return its selector.
+
+        Each screenful is read from one dump and matched locally. A direction
+        is abandoned as soon as a scroll brings no new list items into view
+        (end of list), so a miss costs a few round trips rather than one
+        timeout per target and per scroll.
+        """
+        selectors = target_selectors(targets)
+        index, node = self.wait_for_any(selectors, timeout=initial_wait)
+        snap = self.snapshot(max_age=initial_wait + 1)
+        for direction in directions:
+            seen = visible_items(snap)
+            for _ in range(max_scrolls):
+                if node is not None:
+                    break
+                container = scroll_container(snap)
+                if container is None or not self.scroll(direction, container):
+                    self.log(f"   No scrollable list for '{description}'.")
+                    break
+                snap = self.wait_idle()
+                index, node = snap.first_match(selectors)
+                new_items = visible_items(snap) - seen
+                if node is None and not new_items:
+                    self.log(f"   Reached the end of the list ({direction}).")
+                    break
+                seen |= new_items
+            if node is not None and click:
+                index, node = self.click_current(selectors)
+                if node is not None:
+                    self.wait_idle()
+                    self.log(f"👍 Clicked: {description or targets} ({describe_node(node)})")
+            if node is not None:
+                return selectors[index]
+        self.log(f"❌ Could not find any of {targets} for '{description}' after scrolling.")
+        return None
+
+    def dump(self):
+        """Print the visible elements of the current snapshot (for debugging)."""
+        self.log("\n🔍 Dumping visible UI elements:")
+        try:
+            for line_num, node in enumerate(self.snapshot().nodes):
+                summary = describe_node(node)
+                if summary:
+                    self.log(f"  - L{line_num} | {summary}")
+        except Exception as e:
+            self.log(f"Failed to dump UI tree: {e}")
+        self.log("--- End of UI Dump ---\n")
+
+
+def scroll_container(snapshot):
+    """Return the largest scrollable node of a snapshot (the main list), if any."""
+    best, best_area = None, 0
+    for node in snapshot.find_all({"scrollable": True}):
+        left, top, right, bottom = node["_bounds"]
+        area = (right - left) * (bottom - top)
+        if area > best_area:
+            best, best_area = node, area
+    return best
+
+
+def visible_items(snapshot):
+    """Identify the currently visible list items by their text and description."""
+    return {(n.get("resource-id", ""), n.get("text", ""), n.get("content-desc", ""))
+            for n in snapshot.nodes if n.get("text") or n.get("content-desc")}
+
+
+def target_selectors(targets):
+    """Expand scroll targets: plain strings try exact text before textContains."""
+    selectors = []
+    for item in targets:
+        if isinstance(item, str):
+            selectors.append({"text": item})
+        else:
+            selectors.append(item)
+    for item in targets:
+        if isinstance(item, str):
+            selectors.append({"textContains": item})
+    return selectors